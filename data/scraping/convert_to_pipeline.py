@@ -11,11 +11,55 @@ Writes: data/processed/prices.json
 Then:   Run `python3 data/scripts/05_compute_scores.py` to rebuild the GeoJSON.
 """
 import json
+import os
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 SCRAPING_DIR = Path(__file__).parent
 PROCESSED_DIR = SCRAPING_DIR.parent / "processed"
 
+# Outputs are consumed programmatically; compact JSON by default,
+# PRETTY=1 for a human-readable dev variant
+PRETTY = os.environ.get("PRETTY", "0") == "1"
+
+
+def load_json(path):
+    """Load a JSON file, using orjson when available (much faster)."""
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dump_json(obj, path):
+    """Write a JSON file (compact unless PRETTY=1), using orjson when available."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+        if PRETTY:
+            option |= orjson.OPT_INDENT_2
+        # Write the serialized blob straight through the OS, skipping
+        # Python's buffered file object (one syscall for multi-MB outputs)
+        buf = orjson.dumps(obj, option=option)
+        fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(buf)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                obj, f, ensure_ascii=False,
+                indent=2 if PRETTY else None,
+                separators=None if PRETTY else (",", ":"),
+            )
+
 
 def main():
     # Load scraped prices
@@ -24,8 +68,7 @@ def main():
         print(f"ERROR: {scraped_path} not found. Run OpenClaw scraper first.")
         return
 
-    with open(scraped_path) as f:
-        scraped = json.load(f)
+    scraped = load_json(scraped_path)
 
     print(f"Loaded {len(scraped)} scraped prices")
 
@@ -68,24 +111,23 @@ def main():
     # Load existing prices to fill gaps
     existing_path = PROCESSED_DIR / "prices.json"
     if existing_path.exists():
-        with open(existing_path) as f:
-            existing = json.load(f)
+        existing = load_json(existing_path)
+
+        # Count how many we're upgrading vs keeping (set arithmetic on key views)
+        upgraded = len(prices.keys() & existing.keys())
+        kept = len(existing.keys() - prices.keys())
 
-        # Count how many we're upgrading vs keeping
-        upgraded = sum(1 for k in prices if k in existing)
-        kept = 0
-        for k, v in existing.items():
-            if k not in prices:
-                prices[k] = v
-                kept += 1
+        # Merge: scraped prices override existing estimates
+        merged = dict(existing)
+        merged.update(prices)
+        prices = merged
 
         print(f"Upgraded {upgraded} existing estimates with real prices")
         print(f"Kept {kept} existing estimates (no scraped data available)")
 
     # Save
     out_path = PROCESSED_DIR / "prices.json"
-    with open(out_path, "w") as f:
-        json.dump(prices, f, indent=2)
+    dump_json(prices, out_path)
 
     print(f"\nSaved {len(prices)} prices to {out_path}")
     print(f"  Real (scraped): {used}")
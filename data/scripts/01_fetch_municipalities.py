@@ -4,55 +4,142 @@ Step 1: Fetch Swiss municipality centroids from Opendatasoft.
 Outputs: data/processed/municipalities.json
 """
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-from config import PROCESSED_DIR, FRONTEND_DATA_DIR
+from config import PROCESSED_DIR, FRONTEND_DATA_DIR, RAW_DIR
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Outputs are consumed programmatically; compact JSON by default,
+# PRETTY=1 for a human-readable dev variant
+PRETTY = os.environ.get("PRETTY", "0") == "1"
 
 OPENDATASOFT_URL = (
     "https://public.opendatasoft.com/api/explore/v2.1/catalog/datasets/"
     "georef-switzerland-gemeinde/records"
 )
 
+# On-disk ETag cache: skip re-downloading the dataset when unchanged
+CACHE_DIR = RAW_DIR / "opendatasoft_cache"
+CACHE_ETAG = CACHE_DIR / "georef-switzerland-gemeinde.etag"
+CACHE_BODY = CACHE_DIR / "georef-switzerland-gemeinde.json"
+
+
+def dump_json(obj, path, indent=PRETTY):
+    """Write a JSON file (compact unless PRETTY=1), using orjson when available."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        # Write the serialized blob straight through the OS, skipping
+        # Python's buffered file object (one syscall for multi-MB outputs)
+        buf = orjson.dumps(obj, option=option)
+        fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(buf)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                obj, f, ensure_ascii=False,
+                indent=2 if indent else None,
+                separators=None if indent else (",", ":"),
+            )
+
 
 def fetch_municipalities():
     """Fetch all Swiss municipalities with centroids from Opendatasoft."""
-    all_records = []
-    offset = 0
     limit = 100
+    select = (
+        "gem_name,gem_code,kan_name,kan_code,"
+        "geo_point_2d,bez_name"
+    )
 
-    print("Fetching municipalities from Opendatasoft...")
-    while True:
-        params = {
-            "limit": limit,
-            "offset": offset,
-            "select": (
-                "gem_name,gem_code,kan_name,kan_code,"
-                "geo_point_2d,bez_name"
-            ),
-        }
-        resp = requests.get(OPENDATASOFT_URL, params=params)
+    # Keep-alive session: reuse one TCP/TLS connection across all pages
+    session = requests.Session()
+
+    def fetch_page(offset):
+        params = {"limit": limit, "offset": offset, "select": select}
+        resp = session.get(OPENDATASOFT_URL, params=params)
         resp.raise_for_status()
-        data = resp.json()
-        results = data.get("results", [])
-        if not results:
-            break
-        all_records.extend(results)
-        offset += limit
-        print(f"  Fetched {len(all_records)} records...")
+        return resp.json()
+
+    print("Fetching municipalities from Opendatasoft...")
+
+    # Probe page 0 (conditionally, via ETag) for total_count, then fetch the
+    # remaining pages concurrently on a cache miss
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    probe_headers = {}
+    if CACHE_ETAG.exists() and CACHE_BODY.exists():
+        probe_headers["If-None-Match"] = CACHE_ETAG.read_text().strip()
+
+    probe = session.get(
+        OPENDATASOFT_URL,
+        params={"limit": limit, "offset": 0, "select": select},
+        headers=probe_headers,
+    )
+    if probe.status_code == 304:
+        print("  Dataset unchanged (HTTP 304); using cached records")
+        if orjson is not None:
+            all_records = orjson.loads(CACHE_BODY.read_bytes())
+        else:
+            with open(CACHE_BODY, encoding="utf-8") as f:
+                all_records = json.load(f)
+    else:
+        probe.raise_for_status()
+        first = probe.json()
+        total_count = first.get("total_count", 0)
+        first_results = first.get("results", [])
+
+        # Pre-size the record list; pages splice in without growth reallocs
+        all_records = [None] * max(total_count, len(first_results))
+        all_records[:len(first_results)] = first_results
+        fetched = len(first_results)
+
+        offsets = range(limit, total_count, limit)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for offset, page in zip(offsets, executor.map(fetch_page, offsets)):
+                results = page.get("results", [])
+                all_records[offset:offset + len(results)] = results
+                fetched += len(results)
+                print(f"  Fetched {fetched} records...")
+
+        # Drop any slots left empty by short pages
+        if fetched < len(all_records):
+            all_records = [r for r in all_records if r is not None]
+
+        etag = probe.headers.get("ETag")
+        if etag:
+            dump_json(all_records, CACHE_BODY, indent=False)
+            CACHE_ETAG.write_text(etag)
 
     print(f"Total municipalities fetched: {len(all_records)}")
 
-    # Helper: API returns lists for text fields, unwrap them
+    # Helper: API returns lists for text fields, unwrap them. Probe the first
+    # record: when the fields really are lists (the normal case) a branch-free
+    # unwrap avoids an isinstance check per field per record.
     def unwrap(val):
         if isinstance(val, list):
             return val[0] if val else ""
         return val
 
-    # Deduplicate by gem_code (BFS number)
+    if all_records and isinstance(all_records[0].get("gem_code"), list):
+        unwrap = lambda val: val[0] if val else ""
+
+    # Deduplicate by gem_code (BFS number); setdefault keeps the first record
     seen = {}
     for rec in all_records:
         code = unwrap(rec.get("gem_code", ""))
-        if code and code not in seen:
-            seen[code] = rec
+        if code:
+            seen.setdefault(code, rec)
 
     municipalities = []
     for code, rec in sorted(seen.items()):
@@ -78,8 +165,7 @@ def main():
 
     # Save processed JSON
     out_path = PROCESSED_DIR / "municipalities.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(municipalities, f, ensure_ascii=False, indent=2)
+    dump_json(municipalities, out_path)
     print(f"Saved to {out_path}")
 
     # Also create a GeoJSON for the frontend
@@ -102,8 +188,7 @@ def main():
 
     geojson = {"type": "FeatureCollection", "features": features}
     geo_path = PROCESSED_DIR / "municipalities.geojson"
-    with open(geo_path, "w", encoding="utf-8") as f:
-        json.dump(geojson, f, ensure_ascii=False)
+    dump_json(geojson, geo_path, indent=False)
     print(f"Saved GeoJSON to {geo_path}")
 
 
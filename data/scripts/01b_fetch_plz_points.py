@@ -16,48 +16,137 @@ Outputs:
   - data/processed/plz_municipality_map.json (PLZ → municipality mapping)
 """
 import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
-from config import PROCESSED_DIR
+from config import PROCESSED_DIR, RAW_DIR
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Outputs are consumed programmatically; compact JSON by default,
+# PRETTY=1 for a human-readable dev variant
+PRETTY = os.environ.get("PRETTY", "0") == "1"
 
 OPENDATASOFT_PLZ_URL = (
     "https://public.opendatasoft.com/api/explore/v2.1/catalog/datasets/"
     "georef-switzerland-postleitzahl/records"
 )
 
+# On-disk ETag cache: skip re-downloading the dataset when unchanged
+CACHE_DIR = RAW_DIR / "opendatasoft_cache"
+CACHE_ETAG = CACHE_DIR / "georef-switzerland-postleitzahl.etag"
+CACHE_BODY = CACHE_DIR / "georef-switzerland-postleitzahl.json"
+
+
+def load_json(path):
+    """Load a JSON file, using orjson when available (much faster)."""
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dump_json(obj, path):
+    """Write a JSON file (compact unless PRETTY=1), using orjson when available."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+        if PRETTY:
+            option |= orjson.OPT_INDENT_2
+        # Write the serialized blob straight through the OS, skipping
+        # Python's buffered file object (one syscall for multi-MB outputs)
+        buf = orjson.dumps(obj, option=option)
+        fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(buf)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                obj, f, ensure_ascii=False,
+                indent=2 if PRETTY else None,
+                separators=None if PRETTY else (",", ":"),
+            )
+
 
 def fetch_plz_points():
     """Fetch all Swiss PLZ points with coordinates and municipality mapping."""
-    all_records = []
-    offset = 0
     limit = 100
+    select = (
+        "plz_code,kan_code,kan_name,"
+        "bez_code,bez_name,gem_code,gem_name,"
+        "geo_point_2d"
+    )
 
-    print("Fetching PLZ points from Opendatasoft...")
-    while True:
-        params = {
-            "limit": limit,
-            "offset": offset,
-            "select": (
-                "plz_code,kan_code,kan_name,"
-                "bez_code,bez_name,gem_code,gem_name,"
-                "geo_point_2d"
-            ),
-        }
-        resp = requests.get(OPENDATASOFT_PLZ_URL, params=params)
+    # Keep-alive session: reuse one TCP/TLS connection across all pages
+    session = requests.Session()
+
+    def fetch_page(offset):
+        params = {"limit": limit, "offset": offset, "select": select}
+        resp = session.get(OPENDATASOFT_PLZ_URL, params=params)
         resp.raise_for_status()
-        data = resp.json()
-        results = data.get("results", [])
-        if not results:
-            break
-        all_records.extend(results)
-        offset += limit
-        if offset % 500 == 0:
-            print(f"  Fetched {len(all_records)} records...")
+        return resp.json()
+
+    print("Fetching PLZ points from Opendatasoft...")
+
+    # Probe page 0 (conditionally, via ETag) for total_count, then fetch the
+    # remaining pages concurrently on a cache miss
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    probe_headers = {}
+    if CACHE_ETAG.exists() and CACHE_BODY.exists():
+        probe_headers["If-None-Match"] = CACHE_ETAG.read_text().strip()
+
+    probe = session.get(
+        OPENDATASOFT_PLZ_URL,
+        params={"limit": limit, "offset": 0, "select": select},
+        headers=probe_headers,
+    )
+    if probe.status_code == 304:
+        print("  Dataset unchanged (HTTP 304); using cached records")
+        all_records = load_json(CACHE_BODY)
+    else:
+        probe.raise_for_status()
+        first = probe.json()
+        total_count = first.get("total_count", 0)
+        first_results = first.get("results", [])
+
+        # Pre-size the record list; pages splice in without growth reallocs
+        all_records = [None] * max(total_count, len(first_results))
+        all_records[:len(first_results)] = first_results
+        fetched = len(first_results)
+
+        offsets = range(limit, total_count, limit)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for offset, page in zip(offsets, executor.map(fetch_page, offsets)):
+                results = page.get("results", [])
+                all_records[offset:offset + len(results)] = results
+                fetched += len(results)
+                if fetched % 500 == 0:
+                    print(f"  Fetched {fetched} records...")
+
+        # Drop any slots left empty by short pages
+        if fetched < len(all_records):
+            all_records = [r for r in all_records if r is not None]
+
+        etag = probe.headers.get("ETag")
+        if etag:
+            dump_json(all_records, CACHE_BODY)
+            CACHE_ETAG.write_text(etag)
 
     print(f"Total PLZ records fetched: {len(all_records)}")
 
-    # Helper: ensure value is a list
+    # Helper: ensure value is a list. Probe the first record: when the array
+    # fields really are lists (the normal case) a branch-free version avoids
+    # three isinstance checks per record.
     def as_list(val):
         if isinstance(val, list):
             return val
@@ -65,12 +154,18 @@ def fetch_plz_points():
             return []
         return [val]
 
+    if all_records and all(
+        isinstance(all_records[0].get(k), (list, type(None)))
+        for k in ("plz_code", "gem_code", "gem_name")
+    ):
+        as_list = lambda val: val or []
+
     # Build two outputs:
     # 1. Unique PLZ points (for travel time queries) — one per PLZ
     # 2. PLZ → municipality mapping (one PLZ can serve multiple municipalities)
     plz_points = {}  # plz_code → { plz, name, lat, lon }
-    plz_muni_map = {}  # plz_code → [municipality_id, ...]
-    muni_plz_map = {}  # municipality_id → [plz_code, ...]
+    plz_muni_map = defaultdict(set)  # plz_code → {municipality_id, ...}
+    muni_plz_map = defaultdict(set)  # municipality_id → {plz_code, ...}
 
     for rec in all_records:
         geo = rec.get("geo_point_2d", {})
@@ -95,14 +190,11 @@ def fetch_plz_points():
                 "lon": geo["lon"],
             }
 
-        # Map PLZ → all municipalities it covers
-        if plz not in plz_muni_map:
-            plz_muni_map[plz] = set()
+        # Map PLZ → all municipalities it covers (and the inverse)
+        plz_munis = plz_muni_map[plz]
         for gc in gem_codes:
             gc_str = str(gc)
-            plz_muni_map[plz].add(gc_str)
-            if gc_str not in muni_plz_map:
-                muni_plz_map[gc_str] = set()
+            plz_munis.add(gc_str)
             muni_plz_map[gc_str].add(plz)
 
     # Convert sets to sorted lists
@@ -117,12 +209,20 @@ def fetch_plz_points():
     print(f"  {len(muni_plz_map)} municipalities covered")
     print(f"  PLZ per municipality distribution:")
 
-    counts = [len(v) for v in muni_plz_map.values()]
-    for n in [1, 2, 3, 5, 10]:
-        c = sum(1 for x in counts if x >= n)
+    # Single pass over the counts: threshold tallies + running sum together
+    thresholds = [1, 2, 3, 5, 10]
+    at_least = [0] * len(thresholds)
+    total_plz = 0
+    for v in muni_plz_map.values():
+        c = len(v)
+        total_plz += c
+        for i, n in enumerate(thresholds):
+            if c >= n:
+                at_least[i] += 1
+    for n, c in zip(thresholds, at_least):
         print(f"    >= {n} PLZ: {c} municipalities")
 
-    avg_plz = sum(counts) / len(counts) if counts else 0
+    avg_plz = total_plz / len(muni_plz_map) if muni_plz_map else 0
     print(f"    Average: {avg_plz:.1f} PLZ per municipality")
 
     return plz_list, plz_muni_map, muni_plz_map
@@ -134,8 +234,7 @@ def main():
     # Check coverage against municipalities.json
     muni_path = PROCESSED_DIR / "municipalities.json"
     if muni_path.exists():
-        with open(muni_path) as f:
-            municipalities = json.load(f)
+        municipalities = load_json(muni_path)
         all_muni_ids = set(m["id"] for m in municipalities)
         covered = all_muni_ids & set(muni_plz_map.keys())
         missing = all_muni_ids - covered
@@ -143,14 +242,16 @@ def main():
         print(f"  {len(covered)}/{len(all_muni_ids)} municipalities have PLZ data")
         print(f"  {len(missing)} municipalities missing PLZ mapping")
         if missing:
-            # For missing municipalities, they'll fall back to their original centroid
-            muni_by_id = {m["id"]: m for m in municipalities}
-            print(f"  Missing examples: {[muni_by_id[m]['name'] for m in sorted(missing)[:5]]}")
+            # For missing municipalities, they'll fall back to their original
+            # centroid. Only resolve names for the sampled ids — no need for a
+            # full id→municipality dict just to print five examples.
+            sample = set(sorted(missing)[:5])
+            examples = [m["name"] for m in municipalities if m["id"] in sample]
+            print(f"  Missing examples: {examples}")
 
     # Save PLZ points (for travel time fetching)
     out_path = PROCESSED_DIR / "plz_points.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(plz_list, f, ensure_ascii=False, indent=2)
+    dump_json(plz_list, out_path)
     print(f"\nSaved {len(plz_list)} PLZ points to {out_path}")
 
     # Save mapping files
@@ -159,8 +260,7 @@ def main():
         "municipality_to_plz": muni_plz_map,
     }
     map_path = PROCESSED_DIR / "plz_municipality_map.json"
-    with open(map_path, "w", encoding="utf-8") as f:
-        json.dump(mapping, f, ensure_ascii=False, indent=2)
+    dump_json(mapping, map_path)
     print(f"Saved mapping to {map_path}")
 
 
@@ -19,8 +19,14 @@ Outputs:
   - data/processed/settlement_municipality_map.json (bidirectional mapping)
 """
 import csv
+import io
 import json
+import os
 import sys
+import threading
+from collections import Counter
+
+import numpy as np
 import time as time_mod
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
@@ -29,30 +35,101 @@ import requests
 
 from config import PROCESSED_DIR, RAW_DIR
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(**kwargs):
+        def wrap(f):
+            return f
+        return wrap
+
+try:
+    from shapely import STRtree
+    from shapely.geometry import Point, shape
+except ImportError:
+    STRtree = None
+
+# Outputs are consumed programmatically; compact JSON by default,
+# PRETTY=1 for a human-readable dev variant
+PRETTY = os.environ.get("PRETTY", "0") == "1"
+
 # swissNAMES3D CSV file (polygon layer contains settlements)
 SWISSNAMES_PLY = RAW_DIR / "csv_LV95_LN02" / "swissNAMES3D_PLY.csv"
 
-# Minimum population category to include
-MIN_POP_CATEGORIES = {
+# Minimum population category to include. Interned frozenset: membership
+# tests in the hot CSV loop resolve on pointer equality for interned probes.
+MIN_POP_CATEGORIES = frozenset(map(sys.intern, (
     "100 bis 999",
     "1'000 bis 1'999",
     "2'000 bis 9'999",
     "10'000 bis 49'999",
     "50'000 bis 100'000",
     "> 100'000",
-}
+)))
 
-# geo.admin.ch identify API for municipality lookup
+# geo.admin.ch identify API for municipality lookup (network fallback)
 GEO_ADMIN_URL = "https://api3.geo.admin.ch/rest/services/api/MapServer/identify"
 MUNICIPALITY_LAYER = "ch.swisstopo.swissboundaries3d-gemeinde-flaeche.fill"
 
+# Municipality polygons for local reverse geocoding (preferred path)
+OPENDATASOFT_POLY_URL = (
+    "https://public.opendatasoft.com/api/explore/v2.1/catalog/datasets/"
+    "georef-switzerland-gemeinde/exports/geojson"
+)
+MUNICIPALITY_POLYGONS = RAW_DIR / "municipality_polygons.geojson"
+
+# Opendatasoft carries full canton names; the identify API (and our outputs)
+# use the two-letter abbreviations
+KANTON_ABBREV = {
+    "Zürich": "ZH", "Bern": "BE", "Luzern": "LU", "Uri": "UR",
+    "Schwyz": "SZ", "Obwalden": "OW", "Nidwalden": "NW", "Glarus": "GL",
+    "Zug": "ZG", "Fribourg": "FR", "Solothurn": "SO", "Basel-Stadt": "BS",
+    "Basel-Landschaft": "BL", "Schaffhausen": "SH",
+    "Appenzell Ausserrhoden": "AR", "Appenzell Innerrhoden": "AI",
+    "St. Gallen": "SG", "Graubünden": "GR", "Aargau": "AG", "Thurgau": "TG",
+    "Ticino": "TI", "Vaud": "VD", "Valais": "VS", "Neuchâtel": "NE",
+    "Genève": "GE", "Jura": "JU",
+}
+
 # Concurrency settings
 MAX_WORKERS = 20  # concurrent API requests
 SAVE_INTERVAL = 500  # save progress every N settlements
 
 
+def dump_json(obj, path):
+    """Write a JSON file (compact unless PRETTY=1), using orjson when available."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+        if PRETTY:
+            option |= orjson.OPT_INDENT_2
+        # Write the serialized blob straight through the OS, skipping
+        # Python's buffered file object (one syscall for multi-MB outputs)
+        buf = orjson.dumps(obj, option=option)
+        fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(buf)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                obj, f, ensure_ascii=False,
+                indent=2 if PRETTY else None,
+                separators=None if PRETTY else (",", ":"),
+            )
+
+
+@njit(cache=True, fastmath=True)
 def lv95_to_wgs84(e, n):
-    """Convert Swiss LV95 (E, N) to WGS84 (lat, lon)."""
+    """Convert Swiss LV95 (E, N) to WGS84 (lat, lon). Scalar path (Numba-compiled
+    when available); the batch path below uses NumPy instead."""
     y = (e - 2_600_000) / 1_000_000
     x = (n - 1_200_000) / 1_000_000
     lon_sec = (
@@ -66,36 +143,90 @@ def lv95_to_wgs84(e, n):
     return lat_sec * 100 / 36, lon_sec * 100 / 36
 
 
+def lv95_to_wgs84_arrays(e, n):
+    """Vectorized LV95 → WGS84 over float64 arrays. Same polynomial as above."""
+    y = (e - 2_600_000) / 1_000_000
+    x = (n - 1_200_000) / 1_000_000
+    yx = y * x
+    yy = y * y
+    xx = x * x
+    lon_sec = 2.6779094 + 4.728982 * y + 0.791484 * yx + 0.1306 * yx * x - 0.0436 * yy * y
+    lat_sec = 16.9023892 + 3.238272 * x - 0.270978 * yy - 0.002528 * xx - 0.0447 * yy * x - 0.0140 * xx * x
+    return lat_sec * (100 / 36), lon_sec * (100 / 36)
+
+
 def extract_settlements():
     """Extract settlements with >= 100 inhabitants from swissNAMES3D."""
-    settlements = []
-    with open(SWISSNAMES_PLY, encoding="utf-8-sig") as f:
-        reader = csv.DictReader(f, delimiter=";")
+    # Pass 1: collect rows that pass the filters (coords as raw floats).
+    # csv.reader + precomputed column indices avoids a dict per row; the
+    # cheap string filters run before any field extraction or float parsing.
+    meta = []
+    e_list = []
+    n_list = []
+    # Slurp the ~50MB file in one read (BOM stripped once) so csv works
+    # entirely on in-memory text instead of 8KB buffered reads
+    raw = SWISSNAMES_PLY.read_bytes()
+    if raw.startswith(b"\xef\xbb\xbf"):
+        raw = raw[3:]
+    with io.StringIO(raw.decode("utf-8")) as f:
+        reader = csv.reader(f, delimiter=";")
+        header = next(reader)
+        i_obj = header.index("OBJEKTART")
+        i_pop = header.index("EINWOHNERKATEGORIE")
+        i_e = header.index("E")
+        i_n = header.index("N")
+        i_uuid = header.index("UUID")
+        i_name = header.index("NAME")
         for row in reader:
-            if row["OBJEKTART"] != "Ort":
+            if row[i_obj] != "Ort":
                 continue
-            if row["EINWOHNERKATEGORIE"] not in MIN_POP_CATEGORIES:
+            pop_cat = sys.intern(row[i_pop])
+            if pop_cat not in MIN_POP_CATEGORIES:
                 continue
+            e_list.append(float(row[i_e]))
+            n_list.append(float(row[i_n]))
+            meta.append((row[i_uuid], row[i_name], pop_cat))
 
-            e, n = float(row["E"]), float(row["N"])
-            lat, lon = lv95_to_wgs84(e, n)
+    # Pass 2: convert all coordinates in one vectorized shot
+    e_arr = np.fromiter(e_list, dtype=np.float64, count=len(e_list))
+    n_arr = np.fromiter(n_list, dtype=np.float64, count=len(n_list))
+    lat_arr, lon_arr = lv95_to_wgs84_arrays(e_arr, n_arr)
 
-            settlements.append({
-                "uuid": row["UUID"],
-                "name": row["NAME"],
-                "pop_category": row["EINWOHNERKATEGORIE"],
-                "lat": lat,
-                "lon": lon,
-                "e_lv95": e,
-                "n_lv95": n,
-            })
+    settlements = []
+    for (uuid, name, pop_cat), lat, lon, e, n in zip(meta, lat_arr, lon_arr, e_list, n_list):
+        settlements.append({
+            "uuid": uuid,
+            "name": name,
+            "pop_category": pop_cat,
+            "lat": lat.item(),
+            "lon": lon.item(),
+            "e_lv95": e,
+            "n_lv95": n,
+        })
 
     print(f"Extracted {len(settlements)} settlements with >= 100 inhabitants")
     return settlements
 
 
-def _lookup_one(session, settlement):
-    """Look up municipality for a single settlement. Returns updated settlement dict."""
+# Identify-API results cached by ~100m grid cell (lat/lon rounded to 1e-3°):
+# settlements that share a cell resolve to the same municipality without a
+# second HTTP round-trip. Shared across worker threads, hence the lock.
+_grid_cache = {}
+_grid_lock = threading.Lock()
+
+
+def _lookup_one(session, idx, settlement):
+    """Look up municipality for one settlement. Returns (idx, settlement, success)."""
+    cell = (round(settlement["lat"] * 1000), round(settlement["lon"] * 1000))
+    with _grid_lock:
+        cached = _grid_cache.get(cell)
+    if cached is not None:
+        muni_id, muni_name, canton = cached
+        settlement["municipality_id"] = muni_id
+        settlement["municipality_name"] = muni_name
+        settlement["canton"] = canton
+        return idx, settlement, True
+
     params = {
         "geometry": f"{settlement['lon']},{settlement['lat']}",
         "geometryType": "esriGeometryPoint",
@@ -123,14 +254,83 @@ def _lookup_one(session, settlement):
 
         if best:
             # Zero-pad to 4 digits to match municipality data format
-            settlement["municipality_id"] = str(best["gde_nr"]).zfill(4)
-            settlement["municipality_name"] = best.get("gemname", "")
-            settlement["canton"] = best.get("kanton", "")
-            return settlement, True
+            muni_id = str(best["gde_nr"]).zfill(4)
+            muni_name = best.get("gemname", "")
+            canton = best.get("kanton", "")
+            settlement["municipality_id"] = muni_id
+            settlement["municipality_name"] = muni_name
+            settlement["canton"] = canton
+            with _grid_lock:
+                _grid_cache[cell] = (muni_id, muni_name, canton)
+            return idx, settlement, True
     except Exception as ex:
         pass
 
-    return settlement, False
+    return idx, settlement, False
+
+
+def ensure_municipality_polygons():
+    """Download the municipality polygon GeoJSON once; cached in RAW_DIR."""
+    if MUNICIPALITY_POLYGONS.exists():
+        return MUNICIPALITY_POLYGONS
+    print("Downloading municipality polygons from Opendatasoft (one-time)...")
+    with requests.get(OPENDATASOFT_POLY_URL, stream=True, timeout=300) as r:
+        r.raise_for_status()
+        with open(MUNICIPALITY_POLYGONS, "wb") as f:
+            for chunk in r.iter_content(1 << 20):
+                f.write(chunk)
+    return MUNICIPALITY_POLYGONS
+
+
+def lookup_municipalities_local(settlements):
+    """Reverse-geocode settlements in-process via a polygon R-tree.
+
+    Point-in-polygon over an STRtree is microseconds per settlement, vs. one
+    HTTPS identify call each. Mutates settlements in place; returns the number
+    matched. Unmatched settlements keep no municipality_id and can go through
+    the network fallback.
+    """
+    path = ensure_municipality_polygons()
+    if orjson is not None:
+        data = orjson.loads(path.read_bytes())
+    else:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+
+    def first(val):
+        if isinstance(val, list):
+            return val[0] if val else ""
+        return val or ""
+
+    geoms = []
+    attrs = []
+    for feat in data.get("features", []):
+        props = feat.get("properties", {})
+        code = first(props.get("gem_code"))
+        geom = feat.get("geometry")
+        if not code or not geom:
+            continue
+        kanton = first(props.get("kan_name"))
+        geoms.append(shape(geom))
+        attrs.append((
+            str(code).zfill(4),
+            first(props.get("gem_name")),
+            KANTON_ABBREV.get(kanton, kanton),
+        ))
+
+    tree = STRtree(geoms)
+    found = 0
+    for s in settlements:
+        hits = tree.query(Point(s["lon"], s["lat"]), predicate="intersects")
+        if len(hits):
+            muni_id, muni_name, canton = attrs[hits[0]]
+            s["municipality_id"] = muni_id
+            s["municipality_name"] = muni_name
+            s["canton"] = canton
+            found += 1
+
+    print(f"Local reverse geocoding: {found}/{len(settlements)} settlements matched")
+    return found
 
 
 def lookup_municipalities_concurrent(settlements):
@@ -144,14 +344,13 @@ def lookup_municipalities_concurrent(settlements):
     t0 = time_mod.time()
 
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {
-            executor.submit(_lookup_one, session, s): i
+        futures = [
+            executor.submit(_lookup_one, session, i, s)
             for i, s in enumerate(settlements)
-        }
+        ]
 
         for future in as_completed(futures):
-            idx = futures[future]
-            s, success = future.result()
+            idx, s, success = future.result()
             settlements[idx] = s
             if success:
                 found += 1
@@ -198,8 +397,16 @@ def main():
     # Step 1: Extract settlements from swissNAMES3D
     settlements = extract_settlements()
 
-    # Step 2: Look up municipality for each settlement (concurrent)
-    settlements = lookup_municipalities_concurrent(settlements)
+    # Step 2: Assign municipalities — local point-in-polygon when shapely is
+    # available, identify API only for whatever remains unmatched
+    if STRtree is not None:
+        try:
+            lookup_municipalities_local(settlements)
+        except Exception as ex:
+            print(f"Local reverse geocoding failed ({ex}); using identify API")
+    remaining = [s for s in settlements if not s.get("municipality_id")]
+    if remaining:
+        lookup_municipalities_concurrent(remaining)
 
     # Step 3: Filter out settlements without municipality assignment
     valid = [s for s in settlements if s.get("municipality_id")]
@@ -211,37 +418,36 @@ def main():
 
     # Step 5: Save outputs
     out_points = PROCESSED_DIR / "settlement_points.json"
-    with open(out_points, "w") as f:
-        json.dump(valid, f, indent=2, ensure_ascii=False)
+    dump_json(valid, out_points)
     print(f"\nSaved {len(valid)} settlement points to {out_points}")
 
     mapping = build_mapping(valid)
     out_map = PROCESSED_DIR / "settlement_municipality_map.json"
-    with open(out_map, "w") as f:
-        json.dump(mapping, f, indent=2, ensure_ascii=False)
+    dump_json(mapping, out_map)
     print(f"Saved mapping to {out_map}")
 
-    # Step 6: Summary stats
-    muni_counts = {}
+    # Step 6: Summary stats — counts and name indexes in one pass
+    muni_counts = Counter()
+    muni_names = {}
+    by_name = {}
     for s in valid:
         mid = s["municipality_id"]
-        muni_counts[mid] = muni_counts.get(mid, 0) + 1
+        muni_counts[mid] += 1
+        muni_names.setdefault(mid, s["municipality_name"])
+        by_name.setdefault(s["name"], s)
 
-    avg_per_muni = sum(muni_counts.values()) / max(len(muni_counts), 1)
+    avg_per_muni = len(valid) / max(len(muni_counts), 1)
     if muni_counts:
-        max_count = max(muni_counts.values())
-        max_muni = [k for k, v in muni_counts.items() if v == max_count][0]
-        max_muni_name = next(s["municipality_name"] for s in valid if s["municipality_id"] == max_muni)
+        max_muni, max_count = muni_counts.most_common(1)[0]
         print(f"\nAvg settlements per municipality: {avg_per_muni:.1f}")
-        print(f"Max: {max_muni_name} with {max_count} settlements")
+        print(f"Max: {muni_names[max_muni]} with {max_count} settlements")
 
-    # Spot-check known places
+    # Spot-check known places via the name index (first match wins, as before)
     print("\nSpot checks:")
     for name in ["Galgenen", "Zürich", "Bern", "Lugano", "Dübendorf", "Küsnacht ZH"]:
-        for s in valid:
-            if s["name"] == name:
-                print(f"  {name}: → {s['municipality_name']} (BFS {s['municipality_id']}, {s['canton']})")
-                break
+        s = by_name.get(name)
+        if s:
+            print(f"  {name}: → {s['municipality_name']} (BFS {s['municipality_id']}, {s['canton']})")
 
 
 if __name__ == "__main__":
@@ -18,11 +18,34 @@ Approach:
 Outputs: data/processed/travel_times.json (same format, municipality-keyed)
 """
 import argparse
+import asyncio
 import json
 import math
+import os
 import time as time_mod
+from collections import defaultdict
+from functools import lru_cache
+from urllib.parse import quote
 
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
 
 from config import (
     ARRIVAL_TIME,
@@ -35,48 +58,290 @@ from config import (
     TRAVELTIME_BASE_URL,
 )
 
+# Hoisted once at import: the reference-city parts of every request payload
+# are identical across batches
+CITY_LOCATIONS = [
+    {"id": cid, "coords": {"lat": c["lat"], "lng": c["lon"]}}
+    for cid, c in CITIES.items()
+]
+CITY_COORDS_STR = ";".join(f"{c['lon']},{c['lat']}" for c in CITIES.values())
+CITY_LATLON = [(c["lat"], c["lon"]) for c in CITIES.values()]
+
 TRAVELTIME_MAX_LOCATIONS = 2000
+# Single-city async payloads append the city itself as an extra
+# location, so batches leave one slot of headroom under the API cap
+TRAVELTIME_ASYNC_BATCH = TRAVELTIME_MAX_LOCATIONS - 1
 OSRM_PUBLIC_URL = "https://router.project-osrm.org"
 OSRM_BATCH_SIZE = 90
+# Tile local OSRM too: a 512-point block keeps the durations matrix small
+# (~512 x 10 instead of ~3,181 x 10) and lets the async path overlap the
+# next request with the current block's processing
+LOCAL_OSRM_BATCH = 512
+
+# Shared keep-alive session for the blocking paths: one pooled TCP/TLS
+# connection per host, with retry + backoff on 429/5xx
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=1,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=["GET", "POST"],
+    ),
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
 
 
-def load_plz_data():
-    """Load PLZ points and municipality mapping."""
-    with open(PROCESSED_DIR / "plz_points.json") as f:
-        plz_points = json.load(f)
+def load_json(path):
+    """Load a JSON file, using orjson when available (much faster)."""
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dump_json(obj, path):
+    """Write a compact JSON file atomically, using orjson when available.
+
+    Serializes to a sibling .tmp file and renames it into place, so a crash
+    mid-write never leaves a truncated file that would void the API calls
+    behind it.
+    """
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    if orjson is not None:
+        with open(tmp, "wb", buffering=1 << 20) as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(tmp, "w", encoding="utf-8", buffering=1 << 20) as f:
+            json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def loads_response(resp):
+    """Decode a JSON HTTP response, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(resp.content)
+    return resp.json()
+
+
+def dump_json_zst(obj, path):
+    """Write obj as zstd-compressed JSON at `path` + .zst (atomically).
+
+    The PLZ-level artifacts are mostly low-entropy integer triples, so
+    level-3 zstd shrinks them ~10x and beats the disk. Falls back to plain
+    dump_json when zstandard is unavailable. Returns the path written.
+    """
+    if zstd is None:
+        dump_json(obj, path)
+        return path
+
+    if orjson is not None:
+        payload = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        payload = json.dumps(obj, separators=(",", ":")).encode()
+
+    # One-shot compress (the payload is already in memory) so the frame
+    # header records the content size and decompression can preallocate
+    zpath = path.with_suffix(path.suffix + ".zst")
+    tmp = zpath.with_suffix(zpath.suffix + ".tmp")
+    tmp.write_bytes(zstd.ZstdCompressor(level=3).compress(payload))
+    os.replace(tmp, zpath)
+    return zpath
+
+
+def load_json_zst(path):
+    """Load a JSON artifact written by dump_json_zst (compressed or plain)."""
+    zpath = path.with_suffix(path.suffix + ".zst")
+    if zstd is not None and zpath.exists():
+        data = zstd.ZstdDecompressor().decompress(zpath.read_bytes())
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+    return load_json(path)
+
+
+# Persistent per-point cache: re-runs only query points not seen before.
+# JSONL rows {key, mode, times} keyed by rounded coordinates, so the cache
+# survives PLZ renames and is shared between modes.
+TRAVEL_CACHE_PATH = PROCESSED_DIR / "travel_cache.jsonl"
+
+
+def coord_key(p):
+    return f"{round(p['lat'], 5)},{round(p['lon'], 5)}"
+
+
+def load_travel_cache(mode):
+    """Load cached per-point city times for one mode from the JSONL cache."""
+    cache = {}
+    if TRAVEL_CACHE_PATH.exists():
+        with open(TRAVEL_CACHE_PATH, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                row = orjson.loads(line) if orjson is not None else json.loads(line)
+                if row.get("mode") == mode:
+                    cache[row["key"]] = row["times"]
+    return cache
+
+
+def append_travel_cache(mode, entries):
+    """Append {coord_key: times} rows for one mode to the JSONL cache."""
+    with open(TRAVEL_CACHE_PATH, "ab") as f:
+        for key, times in entries.items():
+            row = {"key": key, "mode": mode, "times": times}
+            if orjson is not None:
+                f.write(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE))
+            else:
+                f.write((json.dumps(row) + "\n").encode())
+
+
+def split_cached_points(points, mode, results):
+    """Fill results from the cache; return the points that still need fetching."""
+    cache = load_travel_cache(mode)
+    if not cache:
+        return points
+
+    to_fetch = []
+    for p in points:
+        times = cache.get(coord_key(p))
+        if times is not None:
+            results[p["plz"]] = times
+        else:
+            to_fetch.append(p)
+    print(f"  {len(points) - len(to_fetch)}/{len(points)} points served from cache")
+    return to_fetch
+
+
+def cache_new_results(points, mode, fetched):
+    """Append freshly fetched, non-empty rows to the cache."""
+    new_entries = {}
+    for p in points:
+        times = fetched.get(p["plz"])
+        if times and any(v is not None for v in times.values()):
+            new_entries[coord_key(p)] = times
+    if new_entries:
+        append_travel_cache(mode, new_entries)
 
-    with open(PROCESSED_DIR / "plz_municipality_map.json") as f:
-        mapping = json.load(f)
 
+def dedupe_points(points):
+    """Collapse points that share a rounded coordinate before fetching.
+
+    Neighboring postal codes can be snapped to the same centroid; there is
+    no reason to route them twice. Returns (unique_points, fanout) where
+    fanout maps each representative's plz to every plz at that coordinate.
+    """
+    unique = {}
+    by_key = defaultdict(list)
+    for p in points:
+        key = coord_key(p)
+        unique.setdefault(key, p)
+        by_key[key].append(p["plz"])
+
+    fanout = {unique[key]["plz"]: plzs for key, plzs in by_key.items()}
+    n_dupes = len(points) - len(unique)
+    if n_dupes:
+        print(f"  {n_dupes} points share a coordinate with another PLZ; deduped")
+    return list(unique.values()), fanout
+
+
+def fan_out_results(results, fanout):
+    """Copy each representative's times to all PLZs sharing its coordinate."""
+    for rep_plz, plzs in fanout.items():
+        times = results.get(rep_plz)
+        if times is None:
+            continue
+        for plz in plzs:
+            if plz != rep_plz:
+                results[plz] = times
+
+
+def load_plz_data():
+    """Load PLZ points and municipality mapping."""
+    plz_points = load_json(PROCESSED_DIR / "plz_points.json")
+    mapping = load_json(PROCESSED_DIR / "plz_municipality_map.json")
     return plz_points, mapping
 
 
 # ─────────────── OSRM Driving ───────────────
 
 
-def fetch_osrm_batch(points_batch, city_list, base_url):
-    """Fetch one batch of driving times from OSRM Table API."""
-    coords_parts = []
-    for p in points_batch:
-        coords_parts.append(f"{p['lon']},{p['lat']}")
-    for city_id in city_list:
-        city = CITIES[city_id]
-        coords_parts.append(f"{city['lon']},{city['lat']}")
-
-    coords_str = ";".join(coords_parts)
+def encode_polyline6(coords):
+    """Encode (lat, lon) pairs as a Google polyline string (precision 6)."""
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in coords:
+        ilat = round(lat * 1e6)
+        ilon = round(lon * 1e6)
+        for delta in (ilat - prev_lat, ilon - prev_lon):
+            v = delta << 1
+            if delta < 0:
+                v = ~v
+            while v >= 0x20:
+                out.append(chr((0x20 | (v & 0x1F)) + 63))
+                v >>= 5
+            out.append(chr(v + 63))
+        prev_lat, prev_lon = ilat, ilon
+    return "".join(out)
+
+
+def build_osrm_table_url(points_batch, city_list, base_url):
+    """Build an OSRM Table API URL for one batch of points.
+
+    The public demo server gets the plain "lon,lat;..." form (small batches);
+    local OSRM gets polyline6-encoded coordinates, which shrinks the URL ~3x
+    when the whole point set goes out in a single request (~5-6 bytes/point
+    vs ~20 for "lon,lat;").
+    """
     n_points = len(points_batch)
 
-    sources = ";".join(str(i) for i in range(n_points))
-    destinations = ";".join(str(n_points + i) for i in range(len(city_list)))
+    if "project-osrm.org" in base_url:
+        # Single join over generators — no intermediate coords list;
+        # the city suffix is the hoisted module constant
+        coords_str = ";".join(f"{p['lon']},{p['lat']}" for p in points_batch)
+        coords_str += ";" + CITY_COORDS_STR
+    else:
+        coords = [(p["lat"], p["lon"]) for p in points_batch]
+        coords.extend(CITY_LATLON)
+        coords_str = f"polyline6({quote(encode_polyline6(coords), safe='')})"
+
+    # Batches share a handful of sizes, so the index strings are memoized.
+    # (A POST body would avoid the URL entirely, but osrm-backend's table
+    # service only speaks GET — hence polyline6 above for the long case.)
+    sources, destinations = _index_params(n_points, len(city_list))
 
-    url = (
+    return (
         f"{base_url}/table/v1/driving/{coords_str}"
         f"?sources={sources}&destinations={destinations}"
     )
 
-    resp = requests.get(url, timeout=300)
+
+@lru_cache(maxsize=None)
+def _index_params(n_points, n_cities):
+    """Memoized sources/destinations index strings for one batch shape."""
+    sources = ";".join(map(str, range(n_points)))
+    destinations = ";".join(map(str, range(n_points, n_points + n_cities)))
+    return sources, destinations
+
+
+def store_osrm_durations(results, batch, city_list, durations):
+    """Store one batch's OSRM duration matrix into the results dict."""
+    for i, p in enumerate(batch):
+        plz_times = {}
+        for j, city_id in enumerate(city_list):
+            val = durations[i][j]
+            plz_times[city_id] = round(val) if val is not None else None
+        results[p["plz"]] = plz_times
+
+
+def fetch_osrm_batch(points_batch, city_list, base_url):
+    """Fetch one batch of driving times from OSRM Table API (blocking)."""
+    url = build_osrm_table_url(points_batch, city_list, base_url)
+
+    resp = SESSION.get(url, timeout=300)
     resp.raise_for_status()
-    data = resp.json()
+    data = loads_response(resp)
 
     if data.get("code") != "Ok":
         raise RuntimeError(f"OSRM error: {data.get('message', data.get('code'))}")
@@ -84,15 +349,87 @@ def fetch_osrm_batch(points_batch, city_list, base_url):
     return data["durations"]
 
 
+async def fetch_osrm_driving_async(plz_points, city_list, base_url,
+                                   batch_size, is_public, concurrency):
+    """Fetch all OSRM batches concurrently with a bounded semaphore."""
+    n = len(plz_points)
+    results = {}  # plz_code → { city_id: seconds }
+    sem = asyncio.Semaphore(concurrency)
+    timeout = aiohttp.ClientTimeout(total=300)
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+        async def fetch_batch(batch_start):
+            batch_end = min(batch_start + batch_size, n)
+            batch = plz_points[batch_start:batch_end]
+            url = build_osrm_table_url(batch, city_list, base_url)
+            async with sem:
+                try:
+                    async with session.get(url) as resp:
+                        resp.raise_for_status()
+                        data = await resp.json(content_type=None)
+                    if data.get("code") != "Ok":
+                        raise RuntimeError(
+                            f"OSRM error: {data.get('message', data.get('code'))}"
+                        )
+                    durations = data["durations"]
+                except Exception as e:
+                    print(f"    ERROR in batch {batch_start}-{batch_end}: {e}")
+                    for p in batch:
+                        results[p["plz"]] = {c: None for c in city_list}
+                    if is_public:
+                        await asyncio.sleep(5)
+                    return
+                # Hold the semaphore slot on the public server so the
+                # aggregate request rate stays near its ~1 req/s limit
+                if is_public:
+                    await asyncio.sleep(concurrency * 1.0)
+
+            # Store and persist block by block: only one block's durations
+            # matrix is live at a time, and a crash loses at most one block
+            batch_times = {}
+            store_osrm_durations(batch_times, batch, city_list, durations)
+            cache_new_results(batch, "driving", batch_times)
+            results.update(batch_times)
+            pct = batch_end / n * 100
+            print(f"  OSRM batch {batch_start}-{batch_end} of {n} ({pct:.0f}%)")
+
+        await asyncio.gather(
+            *(fetch_batch(bs) for bs in range(0, n, batch_size))
+        )
+
+    return results
+
+
 def fetch_osrm_driving(plz_points, base_url, batch_size=None):
     """Fetch driving times for all PLZ points using OSRM."""
     is_public = "project-osrm.org" in base_url
     if batch_size is None:
-        batch_size = OSRM_BATCH_SIZE if is_public else len(plz_points)
+        batch_size = OSRM_BATCH_SIZE if is_public else LOCAL_OSRM_BATCH
 
     print(f"  Fetching driving times from OSRM ({base_url}) for {len(plz_points)} PLZ points...")
     city_list = list(CITIES.keys())
+
+    # Backfill previously fetched points from the on-disk cache; only the
+    # remainder hits the network
     results = {}  # plz_code → { city_id: seconds }
+    plz_points = split_cached_points(plz_points, "driving", results)
+    if not plz_points:
+        return results
+    plz_points, fanout = dedupe_points(plz_points)
+
+    if aiohttp is not None:
+        concurrency = 2 if is_public else 8
+        fetched = asyncio.run(fetch_osrm_driving_async(
+            plz_points, city_list, base_url, batch_size, is_public, concurrency
+        ))
+        results.update(fetched)
+        fan_out_results(results, fanout)
+        return results
+
+    # Blocking fallback when aiohttp is unavailable
+    fetched = {}  # plz_code → { city_id: seconds }
     n = len(plz_points)
 
     for batch_start in range(0, n, batch_size):
@@ -107,21 +444,21 @@ def fetch_osrm_driving(plz_points, base_url, batch_size=None):
         except Exception as e:
             print(f"    ERROR in batch: {e}")
             for p in batch:
-                results[p["plz"]] = {c: None for c in city_list}
+                fetched[p["plz"]] = {c: None for c in city_list}
             if is_public:
                 time_mod.sleep(5)
             continue
 
-        for i, p in enumerate(batch):
-            plz_times = {}
-            for j, city_id in enumerate(city_list):
-                val = durations[i][j]
-                plz_times[city_id] = round(val) if val is not None else None
-            results[p["plz"]] = plz_times
+        batch_times = {}
+        store_osrm_durations(batch_times, batch, city_list, durations)
+        cache_new_results(batch, "driving", batch_times)
+        fetched.update(batch_times)
 
         if is_public and batch_end < n:
             time_mod.sleep(1.0)
 
+    results.update(fetched)
+    fan_out_results(results, fanout)
     return results
 
 
@@ -130,12 +467,7 @@ def fetch_osrm_driving(plz_points, base_url, batch_size=None):
 
 def build_traveltime_request(plz_batch, mode, batch_start):
     """Build a TravelTime time-filter request for one batch of PLZ points."""
-    locations = []
-    for city_id, city in CITIES.items():
-        locations.append({
-            "id": city_id,
-            "coords": {"lat": city["lat"], "lng": city["lon"]},
-        })
+    locations = list(CITY_LOCATIONS)
     for p in plz_batch:
         locations.append({
             "id": f"plz_{p['plz']}",
@@ -163,84 +495,232 @@ def build_traveltime_request(plz_batch, mode, batch_start):
     return {"locations": locations, "arrival_searches": searches}
 
 
-def call_traveltime(payload):
-    """Call TravelTime time-filter endpoint."""
-    headers = {
+def build_one_city_search(city_id, plz_batch, mode, batch_start):
+    """Build a TravelTime payload with a single city search for one batch.
+
+    Smaller payloads than the all-cities request, so the async path can fan
+    the K city searches out as parallel HTTP calls instead of one serialized
+    mega-request.
+    """
+    city = CITIES[city_id]
+
+    locations = [{"id": city_id, "coords": {"lat": city["lat"], "lng": city["lon"]}}]
+    locations.extend(
+        {"id": f"plz_{p['plz']}", "coords": {"lat": p["lat"], "lng": p["lon"]}}
+        for p in plz_batch
+    )
+
+    search = {
+        "id": f"to_{city_id}_{batch_start}",
+        "arrival_location_id": city_id,
+        "departure_location_ids": [f"plz_{p['plz']}" for p in plz_batch],
+        "transportation": {
+            "type": mode,
+            # Same walking_time rationale as build_traveltime_request
+            **({"walking_time": 1200} if mode == "public_transport" else {}),
+        },
+        "arrival_time": ARRIVAL_TIME,
+        "travel_time": MAX_TRAVEL_TIME,
+        "properties": ["travel_time"],
+    }
+
+    return {"locations": locations, "arrival_searches": [search]}
+
+
+def traveltime_headers():
+    return {
         "Content-Type": "application/json",
         "X-Application-Id": TRAVELTIME_APP_ID,
         "X-Api-Key": TRAVELTIME_API_KEY,
     }
+
+
+def parse_traveltime_results(data, results):
+    """Merge one TravelTime response into the results dict."""
+    for search_result in data.get("results", []):
+        search_id = search_result["search_id"]
+        city_id = search_id.split("_")[1]
+
+        for loc in search_result.get("locations", []):
+            plz_code = loc["id"].replace("plz_", "")
+            tt = loc["properties"][0]["travel_time"]
+            results.setdefault(plz_code, {})[city_id] = tt
+
+        for unreachable_id in search_result.get("unreachable", []):
+            plz_code = unreachable_id.replace("plz_", "")
+            results.setdefault(plz_code, {})[city_id] = None
+
+
+def call_traveltime(payload):
+    """Call TravelTime time-filter endpoint (blocking).
+
+    429/5xx retries with backoff are handled by the session adapter.
+    """
     url = f"{TRAVELTIME_BASE_URL}/time-filter"
-    resp = requests.post(url, json=payload, headers=headers, timeout=120)
-    if resp.status_code == 429:
-        print("  Rate limited, waiting 60s...")
-        time_mod.sleep(60)
-        resp = requests.post(url, json=payload, headers=headers, timeout=120)
+    resp = SESSION.post(url, json=payload, headers=traveltime_headers(), timeout=120)
     resp.raise_for_status()
-    return resp.json()
+    return loads_response(resp)
 
 
-def fetch_traveltime_pt(plz_points):
-    """Fetch PT travel times for all PLZ points via TravelTime API."""
+async def fetch_traveltime_pt_async(plz_points, concurrency=2):
+    """Fetch all TravelTime PT batches concurrently (bounded to respect quota)."""
+    url = f"{TRAVELTIME_BASE_URL}/time-filter"
+    headers = traveltime_headers()
     results = {}  # plz_code → { city_id: seconds }
     n = len(plz_points)
+    sem = asyncio.Semaphore(concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+
+        # One task per (batch, city): single-city payloads are smaller and
+        # the server computes the K city searches in parallel instead of
+        # serializing them inside one mega-request
+        async def fetch_city_batch(city_id, batch_start):
+            batch_end = min(batch_start + TRAVELTIME_ASYNC_BATCH, n)
+            batch = plz_points[batch_start:batch_end]
+            payload = build_one_city_search(
+                city_id, batch, "public_transport", batch_start
+            )
+            async with sem:
+                while True:
+                    async with session.post(url, json=payload, headers=headers) as resp:
+                        if resp.status == 429:
+                            print("  Rate limited, waiting 60s...")
+                            await asyncio.sleep(60)
+                            continue
+                        resp.raise_for_status()
+                        data = await resp.json()
+                    break
+                await asyncio.sleep(1)
+            parse_traveltime_results(data, results)
+            print(f"  TravelTime PT: {city_id} batch {batch_start}-{batch_end} of {n}")
+
+        await asyncio.gather(
+            *(
+                fetch_city_batch(city_id, bs)
+                for bs in range(0, n, TRAVELTIME_ASYNC_BATCH)
+                for city_id in CITIES
+            )
+        )
 
-    for batch_start in range(0, n, TRAVELTIME_MAX_LOCATIONS):
-        batch_end = min(batch_start + TRAVELTIME_MAX_LOCATIONS, n)
-        batch = plz_points[batch_start:batch_end]
-        print(f"  TravelTime PT: batch {batch_start}-{batch_end} of {n}")
+    return results
 
-        payload = build_traveltime_request(batch, "public_transport", batch_start)
-        data = call_traveltime(payload)
 
-        for search_result in data.get("results", []):
-            search_id = search_result["search_id"]
-            city_id = search_id.split("_")[1]
+def fetch_traveltime_pt(plz_points):
+    """Fetch PT travel times for all PLZ points via TravelTime API."""
+    # Backfill previously fetched points from the on-disk cache; only the
+    # remainder hits the API (saves TravelTime quota on re-runs)
+    results = {}  # plz_code → { city_id: seconds }
+    plz_points = split_cached_points(plz_points, "public_transport", results)
+    if not plz_points:
+        return results
+    plz_points, fanout = dedupe_points(plz_points)
 
-            for loc in search_result.get("locations", []):
-                plz_code = loc["id"].replace("plz_", "")
-                tt = loc["properties"][0]["travel_time"]
-                results.setdefault(plz_code, {})[city_id] = tt
+    if aiohttp is not None:
+        fetched = asyncio.run(fetch_traveltime_pt_async(plz_points))
+    else:
+        # Blocking fallback when aiohttp is unavailable
+        fetched = {}  # plz_code → { city_id: seconds }
+        n = len(plz_points)
 
-            for unreachable_id in search_result.get("unreachable", []):
-                plz_code = unreachable_id.replace("plz_", "")
-                results.setdefault(plz_code, {})[city_id] = None
+        for batch_start in range(0, n, TRAVELTIME_MAX_LOCATIONS):
+            batch_end = min(batch_start + TRAVELTIME_MAX_LOCATIONS, n)
+            batch = plz_points[batch_start:batch_end]
+            print(f"  TravelTime PT: batch {batch_start}-{batch_end} of {n}")
 
-        time_mod.sleep(1)
+            payload = build_traveltime_request(batch, "public_transport", batch_start)
+            data = call_traveltime(payload)
+            parse_traveltime_results(data, fetched)
 
+            time_mod.sleep(1)
+
+    cache_new_results(plz_points, "public_transport", fetched)
+    results.update(fetched)
+    fan_out_results(results, fanout)
     return results
 
 
 # ─────────────── Aggregation ───────────────
 
 
-def aggregate_to_municipalities(plz_times, muni_to_plz):
+# Missing value in the SoA matrices; travel times are always >= 0
+MISSING = np.int32(-1)
+
+
+def times_to_soa(times, city_list):
+    """Pack a {key: {city_id: seconds|None}} dict into structure-of-arrays.
+
+    Returns (keys, matrix) where matrix is int32 of shape (len(keys),
+    len(city_list)) with MISSING (-1) for absent values — 4 bytes per cell
+    instead of a boxed Python int per cell.
+    """
+    keys = list(times)
+    mat = np.full((len(keys), len(city_list)), MISSING, dtype=np.int32)
+    # Iterate each row's own items rather than probing it once per city:
+    # one dict traversal per row, no .get() misses on sparse rows
+    col = {city_id: j for j, city_id in enumerate(city_list)}
+    for i, key in enumerate(keys):
+        for city_id, t in times[key].items():
+            j = col.get(city_id)  # cached rows may predate a CITIES change
+            if j is not None and t is not None:
+                mat[i, j] = t
+    return keys, mat
+
+
+def soa_row_to_times(city_list, row):
+    """Expand one SoA matrix row back into a {city_id: seconds|None} dict."""
+    return {
+        city_id: (None if v < 0 else int(v))
+        for city_id, v in zip(city_list, row)
+    }
+
+
+def aggregate_to_municipalities(plz_times, muni_to_plz, how="min"):
     """
     Aggregate PLZ-level travel times to municipality level.
 
-    For each municipality, take the MINIMUM travel time across all its PLZ points.
-    This represents the best-connected point in the municipality (where commuters
-    would actually live).
+    By default, take the MINIMUM travel time across all PLZ points in each
+    municipality — the best-connected point (where commuters would actually
+    live). ``how="avg"`` averages over the PLZ points instead.
+
+    Vectorized over a structure-of-arrays int32 matrix (MISSING for absent
+    values); each municipality is one NumPy reduction over its row subset,
+    and the dict-of-dicts shape is only materialized for the JSON output.
     """
     city_list = list(CITIES.keys())
-    muni_times = {}
+    plz_codes_seen, mat = times_to_soa(plz_times, city_list)
+    plz_index = {code: i for i, code in enumerate(plz_codes_seen)}
 
+    # For the min-reduction, lift missing cells above any real time
+    ceiling = np.iinfo(np.int32).max
+    lifted = np.where(mat < 0, ceiling, mat)
+
+    muni_times = {}
+    empty = np.full(len(city_list), MISSING)
     for muni_id, plz_codes in muni_to_plz.items():
-        muni_result = {}
-        for city_id in city_list:
-            # Collect all valid times for this city from all PLZ in this municipality
-            times = []
-            for plz in plz_codes:
-                t = plz_times.get(plz, {}).get(city_id)
-                if t is not None:
-                    times.append(t)
-
-            if times:
-                muni_result[city_id] = min(times)  # best PLZ wins
-            else:
-                muni_result[city_id] = None
+        idx = np.fromiter(
+            (plz_index[c] for c in plz_codes if c in plz_index),
+            dtype=np.int32,
+        )
+        if not len(idx):
+            muni_times[muni_id] = soa_row_to_times(city_list, empty)
+            continue
 
-        muni_times[muni_id] = muni_result
+        if how == "min":
+            row = lifted[idx].min(axis=0)
+            row = np.where(row == ceiling, MISSING, row)
+        else:
+            vals = mat[idx]
+            valid = vals >= 0
+            count = valid.sum(axis=0)
+            total = np.where(valid, vals, 0).sum(axis=0)
+            row = np.where(
+                count > 0,
+                np.round(total / np.maximum(count, 1)).astype(np.int64),
+                MISSING,
+            )
+        muni_times[muni_id] = soa_row_to_times(city_list, row)
 
     return muni_times
 
@@ -283,8 +763,7 @@ def main():
     # Load existing travel times (preserves data for modes not being fetched)
     out_path = PROCESSED_DIR / "travel_times.json"
     if out_path.exists():
-        with open(out_path) as f:
-            travel_times = json.load(f)
+        travel_times = load_json(out_path)
         print(f"Loaded existing travel times ({len(travel_times.get('driving', {}))} driving, "
               f"{len(travel_times.get('public_transport', {}))} PT)")
     else:
@@ -295,9 +774,7 @@ def main():
         if args.osrm_public:
             plz_drive = fetch_osrm_driving(plz_points, OSRM_PUBLIC_URL)
         elif args.osrm_local:
-            plz_drive = fetch_osrm_driving(
-                plz_points, OSRM_BASE_URL, batch_size=len(plz_points)
-            )
+            plz_drive = fetch_osrm_driving(plz_points, OSRM_BASE_URL)
         elif TRAVELTIME_APP_ID and TRAVELTIME_API_KEY:
             print("  NOTE: Using TravelTime for driving (OSRM recommended for speed)")
             # TravelTime driving uses same mechanism as PT
@@ -309,29 +786,22 @@ def main():
                 print(f"  TravelTime driving: batch {batch_start}-{batch_end} of {n}")
                 payload = build_traveltime_request(batch, "driving", batch_start)
                 data = call_traveltime(payload)
-                for search_result in data.get("results", []):
-                    search_id = search_result["search_id"]
-                    city_id = search_id.split("_")[1]
-                    for loc in search_result.get("locations", []):
-                        plz_code = loc["id"].replace("plz_", "")
-                        tt = loc["properties"][0]["travel_time"]
-                        plz_drive.setdefault(plz_code, {})[city_id] = tt
-                    for uid in search_result.get("unreachable", []):
-                        plz_code = uid.replace("plz_", "")
-                        plz_drive.setdefault(plz_code, {})[city_id] = None
+                parse_traveltime_results(data, plz_drive)
                 time_mod.sleep(1)
         else:
             print("ERROR: No driving source. Use --osrm-public, --osrm-local, or set TRAVELTIME_APP_ID/KEY")
             return
 
         # Save raw PLZ-level driving times
-        plz_drive_path = PROCESSED_DIR / "plz_travel_times_driving.json"
-        with open(plz_drive_path, "w") as f:
-            json.dump(plz_drive, f)
+        plz_drive_path = dump_json_zst(
+            plz_drive, PROCESSED_DIR / "plz_travel_times_driving.json"
+        )
         print(f"  Saved PLZ-level driving times to {plz_drive_path}")
 
         # Aggregate to municipality level
-        travel_times["driving"] = aggregate_to_municipalities(plz_drive, muni_to_plz)
+        travel_times["driving"] = aggregate_to_municipalities(
+            plz_drive, muni_to_plz, how=args.aggregate
+        )
         print(f"  Aggregated driving to {len(travel_times['driving'])} municipalities")
 
     # ── Public transport times ──
@@ -343,36 +813,41 @@ def main():
             return
 
         # Save raw PLZ-level PT times
-        plz_pt_path = PROCESSED_DIR / "plz_travel_times_pt.json"
-        with open(plz_pt_path, "w") as f:
-            json.dump(plz_pt, f)
+        plz_pt_path = dump_json_zst(
+            plz_pt, PROCESSED_DIR / "plz_travel_times_pt.json"
+        )
         print(f"  Saved PLZ-level PT times to {plz_pt_path}")
 
         # Aggregate to municipality level
-        travel_times["public_transport"] = aggregate_to_municipalities(plz_pt, muni_to_plz)
+        travel_times["public_transport"] = aggregate_to_municipalities(
+            plz_pt, muni_to_plz, how=args.aggregate
+        )
         print(f"  Aggregated PT to {len(travel_times['public_transport'])} municipalities")
 
     # Save final municipality-level travel times
-    with open(out_path, "w") as f:
-        json.dump(travel_times, f)
+    dump_json(travel_times, out_path)
     print(f"\nSaved aggregated travel times to {out_path}")
 
-    # Print stats
+    # Print stats — single pass per mode: reachable flag, sum and count
+    # accumulate together, no intermediate all_times list
     for mode, data in travel_times.items():
         if not data:
             continue
         total = len(data)
-        reachable = sum(
-            1 for m in data.values()
-            if any(v is not None for v in m.values())
-        )
-        all_times = [
-            v for m in data.values()
-            for v in m.values()
-            if v is not None
-        ]
-        if all_times:
-            avg_min = sum(all_times) / len(all_times) / 60
+        reachable = 0
+        time_sum = 0
+        time_count = 0
+        for m in data.values():
+            any_ok = False
+            for v in m.values():
+                if v is not None:
+                    time_sum += v
+                    time_count += 1
+                    any_ok = True
+            if any_ok:
+                reachable += 1
+        if time_count:
+            avg_min = time_sum / time_count / 60
             print(f"  {mode}: {reachable}/{total} reachable, avg {avg_min:.0f} min")
         else:
             print(f"  {mode}: {reachable}/{total} reachable")
@@ -4,17 +4,50 @@ Step 3: Fetch real estate prices from Homegate.ch.
 Scrapes municipality price pages for CHF/m² data.
 Outputs: data/processed/prices.json
 """
+import argparse
+import asyncio
 import json
+import os
+import random
 import re
 import time
+from collections import defaultdict
+from functools import lru_cache
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from config import PROCESSED_DIR
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from config import PROCESSED_DIR, RAW_DIR
 
 # Homegate uses slugified municipality names in URLs
 HOMEGATE_BASE = "https://www.homegate.ch/en/property-prices-m2/city-"
 
+# Scraping is I/O-bound: with aiohttp, keep up to 16 requests in flight
+# while a politeness sleep inside the semaphore preserves per-host pacing
+CONCURRENCY = 16
+POLITENESS_DELAY = 0.5
+
+# Retry transient failures (connection errors, 429, 5xx) with capped
+# exponential backoff + jitter instead of writing the municipality off
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 60.0
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Delay before retry `attempt`, honoring a Retry-After header value."""
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt) + random.uniform(0, 1)
+
 # Headers to mimic a browser request
 HEADERS = {
     "User-Agent": (
@@ -26,34 +59,128 @@ HEADERS = {
     "Accept-Language": "en-US,en;q=0.9,de;q=0.8",
 }
 
+# Keep-alive session for the blocking path: without it every municipality
+# page costs a fresh TCP+TLS handshake. Retries stay in our backoff loop
+# (max_retries=0 here) so Retry-After handling isn't duplicated.
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=0)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+
+# On-disk cache of extracted prices per slug: Homegate prices move on a
+# monthly cadence at most, so re-runs (e.g. while debugging extraction)
+# should not re-download 2000+ pages. Misses (404 / no price) are cached
+# too; transient failures are not.
+CACHE_PATH = RAW_DIR / "homegate_price_cache.json"
+CACHE_TTL = 14 * 86400  # seconds
+
+
+def save_prices(prices, out_path):
+    """Atomically write the prices artifact (also the rerun resume point)."""
+    tmp = out_path.with_suffix(out_path.suffix + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(prices, f, indent=2)
+    os.replace(tmp, out_path)
+
+
+def load_price_cache(force_refresh=False):
+    """Load the slug → {ts, price} cache, dropping expired entries."""
+    if force_refresh or not CACHE_PATH.exists():
+        return {}
+    with open(CACHE_PATH) as f:
+        cache = json.load(f)
+    cutoff = time.time() - CACHE_TTL
+    fresh = {slug: row for slug, row in cache.items() if row.get("ts", 0) >= cutoff}
+    if fresh:
+        print(f"  Price cache: {len(fresh)} fresh entries")
+    return fresh
+
+
+def save_price_cache(cache):
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(CACHE_PATH, "w") as f:
+        json.dump(cache, f)
+
+
+# Umlauts expand to two characters, so they go through one compiled
+# alternation; every single-char mapping collapses into one translate pass
+_MULTI = {"ä": "ae", "ö": "oe", "ü": "ue"}
+_MULTI_RE = re.compile("|".join(map(re.escape, _MULTI)))
+_SLUG_TABLE = str.maketrans({
+    "à": "a", "é": "e", "è": "e", "ê": "e",
+    "ô": "o", "î": "i", "û": "u",
+    " ": "-", "/": "-", "(": "", ")": "",
+    "'": "", ".": "", ",": "",
+})
+_NON_SLUG_RE = re.compile(r"[^a-z0-9-]")
+_DASH_RUN_RE = re.compile(r"-+")
+
 
+@lru_cache(maxsize=None)
 def slugify(name):
-    """Convert municipality name to URL slug."""
+    """Convert municipality name to URL slug (memoized)."""
     slug = name.lower()
-    # Replace special chars
-    replacements = {
-        "ä": "ae", "ö": "oe", "ü": "ue",
-        "à": "a", "é": "e", "è": "e", "ê": "e",
-        "ô": "o", "î": "i", "û": "u",
-        " ": "-", "/": "-", "(": "", ")": "",
-        "'": "", ".": "", ",": "",
-    }
-    for old, new in replacements.items():
-        slug = slug.replace(old, new)
-    slug = re.sub(r"[^a-z0-9-]", "", slug)
-    slug = re.sub(r"-+", "-", slug).strip("-")
+    slug = _MULTI_RE.sub(lambda m: _MULTI[m.group()], slug)
+    slug = slug.translate(_SLUG_TABLE)
+    slug = _NON_SLUG_RE.sub("", slug)
+    slug = _DASH_RUN_RE.sub("-", slug).strip("-")
     return slug
 
 
+_STATE_DECODER = json.JSONDecoder()
+
+
 def extract_initial_state(html):
-    """Extract __INITIAL_STATE__ JSON from page HTML."""
-    pattern = r"window\.__INITIAL_STATE__\s*=\s*({.*?});\s*</script>"
-    match = re.search(pattern, html, re.DOTALL)
-    if match:
-        try:
-            return json.loads(match.group(1))
-        except json.JSONDecodeError:
-            pass
+    """Extract __INITIAL_STATE__ JSON from page HTML.
+
+    Finds the assignment with str.find and parses exactly one JSON value
+    from there with raw_decode — no DOTALL regex backtracking across the
+    whole ~500 KB document.
+    """
+    pos = 0
+    while True:
+        anchor = html.find("window.__INITIAL_STATE__", pos)
+        if anchor == -1:
+            return None
+        # Only honor an occurrence inside an open <script> block — the text
+        # can also show up escaped in JSON payloads or in HTML comments
+        if html.rfind("<script", 0, anchor) > html.rfind("</script", 0, anchor):
+            break
+        pos = anchor + 1
+    start = html.find("=", anchor)
+    if start == -1:
+        return None
+    start += 1
+    while start < len(html) and html[start].isspace():
+        start += 1
+    try:
+        state, _ = _STATE_DECODER.raw_decode(html, start)
+    except json.JSONDecodeError:
+        return None
+    return state if isinstance(state, dict) else None
+
+
+def find_prices(state, max_depth=8):
+    """Fallback scan: first dict in the state tree with a numeric median.
+
+    Iterative explicit-stack DFS in the same pre-order as the old recursive
+    version, without a Python frame per nested dict — Homegate states hold
+    hundreds of them.
+    """
+    stack = [(state, 0)]
+    while stack:
+        obj, depth = stack.pop()
+        median = obj.get("median")
+        if isinstance(median, (int, float)):
+            return obj
+        if depth < max_depth:
+            stack.extend(
+                (v, depth + 1)
+                for v in reversed(list(obj.values()))
+                if type(v) is dict
+            )
     return None
 
 
@@ -62,50 +189,25 @@ def extract_price_from_state(state):
     if not state:
         return None
 
-    # Navigate the state tree - structure may vary
-    # Look for price data in various possible locations
-    try:
-        # Try common paths in the Homegate state
-        pages = state.get("pages", {})
-        price_page = pages.get("propertyPricesPerM2", {})
-        if price_page:
-            data = price_page.get("data", {})
-            buy = data.get("buy", {})
-            apartment = buy.get("apartment", {})
-            median = apartment.get("median")
+    # Structured fast path through the known Homegate layout. Guarded .get
+    # chains instead of try/except: an unexpected shape just falls through,
+    # without the cost of raising, and the scan below stays off the hot path.
+    pages = state.get("pages")
+    price_page = pages.get("propertyPricesPerM2") if isinstance(pages, dict) else None
+    data = price_page.get("data") if isinstance(price_page, dict) else None
+    buy = data.get("buy") if isinstance(data, dict) else None
+    if isinstance(buy, dict):
+        for segment, price_type in (("apartment", "apartment_buy"),
+                                    ("house", "house_buy")):
+            seg = buy.get(segment)
+            median = seg.get("median") if isinstance(seg, dict) else None
             if median is not None:
                 return {
                     "chf_per_m2": median,
-                    "min": apartment.get("min"),
-                    "max": apartment.get("max"),
-                    "type": "apartment_buy",
+                    "min": seg.get("min"),
+                    "max": seg.get("max"),
+                    "type": price_type,
                 }
-            # Try house prices
-            house = buy.get("house", {})
-            median_h = house.get("median")
-            if median_h is not None:
-                return {
-                    "chf_per_m2": median_h,
-                    "min": house.get("min"),
-                    "max": house.get("max"),
-                    "type": "house_buy",
-                }
-    except (AttributeError, KeyError, TypeError):
-        pass
-
-    # Fallback: search for any price-like structure
-    def find_prices(obj, depth=0):
-        if depth > 8 or not isinstance(obj, dict):
-            return None
-        # Look for keys that suggest price data
-        if "median" in obj and isinstance(obj.get("median"), (int, float)):
-            return obj
-        for v in obj.values():
-            if isinstance(v, dict):
-                result = find_prices(v, depth + 1)
-                if result:
-                    return result
-        return None
 
     price_obj = find_prices(state)
     if price_obj and price_obj.get("median"):
@@ -120,50 +222,181 @@ def extract_price_from_state(state):
 
 
 def fetch_price_for_municipality(name):
-    """Fetch CHF/m² for a single municipality from Homegate."""
+    """Fetch CHF/m² for a single municipality from Homegate.
+
+    Returns (price, definitive). definitive is False only when every
+    attempt failed transiently — those outcomes must not be cached.
+    """
     slug = slugify(name)
     url = f"{HOMEGATE_BASE}{slug}"
-    try:
-        resp = requests.get(url, headers=HEADERS, timeout=15)
-        if resp.status_code == 404:
-            return None
-        resp.raise_for_status()
-        state = extract_initial_state(resp.text)
-        return extract_price_from_state(state)
-    except requests.RequestException:
-        return None
+    for attempt in range(MAX_ATTEMPTS):
+        retry_after = None
+        try:
+            resp = SESSION.get(url, timeout=15)
+            if resp.status_code == 404:
+                return None, True
+            if resp.status_code == 429 or resp.status_code >= 500:
+                retry_after = resp.headers.get("Retry-After")
+            else:
+                resp.raise_for_status()
+                state = extract_initial_state(resp.text)
+                return extract_price_from_state(state), True
+        except requests.RequestException:
+            pass
+        if attempt < MAX_ATTEMPTS - 1:
+            time.sleep(backoff_delay(attempt, retry_after))
+    return None, False
 
 
-def main():
-    # Load municipalities
-    with open(PROCESSED_DIR / "municipalities.json") as f:
-        municipalities = json.load(f)
+async def fetch_prices_async(municipalities, cache, prices, out_path):
+    """Fetch all municipality prices concurrently (bounded, polite).
 
-    print(f"Fetching prices for {len(municipalities)} municipalities...")
+    New results land in the shared `prices` dict, which is flushed to disk
+    every 50 slugs so an interrupt keeps what was already paid for.
+    """
+    # One request per distinct slug; municipalities sharing a display name
+    # (and therefore a slug) fan out from the same response
+    by_slug = defaultdict(list)
+    for m in municipalities:
+        by_slug[slugify(m["name"])].append(m["id"])
+    if len(by_slug) < len(municipalities):
+        print(f"  {len(municipalities) - len(by_slug)} municipalities share a slug; deduped")
 
-    prices = {}
-    success = 0
-    errors = 0
+    to_fetch = {}
+    for slug, muni_ids in by_slug.items():
+        row = cache.get(slug)
+        if row is not None:
+            if row.get("price"):
+                for muni_id in muni_ids:
+                    prices[muni_id] = row["price"]
+        else:
+            to_fetch[slug] = muni_ids
+    if len(to_fetch) < len(by_slug):
+        print(f"  {len(by_slug) - len(to_fetch)}/{len(by_slug)} slugs served from cache")
+
+    done = 0
+    sem = asyncio.Semaphore(CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=15)
+
+    async with aiohttp.ClientSession(headers=HEADERS, timeout=timeout) as session:
+
+        async def bounded_fetch(slug, muni_ids):
+            nonlocal done
+            url = f"{HOMEGATE_BASE}{slug}"
+            html = None
+            not_found = False
+            async with sem:
+                for attempt in range(MAX_ATTEMPTS):
+                    retry_after = None
+                    try:
+                        async with session.get(url) as resp:
+                            if resp.status == 404:
+                                not_found = True
+                                break
+                            if resp.status == 429 or resp.status >= 500:
+                                retry_after = resp.headers.get("Retry-After")
+                            else:
+                                resp.raise_for_status()
+                                html = await resp.text()
+                                break
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        pass
+                    if attempt < MAX_ATTEMPTS - 1:
+                        await asyncio.sleep(backoff_delay(attempt, retry_after))
+                # Hold the semaphore slot through the politeness delay so
+                # the aggregate request rate matches the old serial pacing
+                await asyncio.sleep(POLITENESS_DELAY)
+
+            price = None
+            if html is not None:
+                price = extract_price_from_state(extract_initial_state(html))
+            if html is not None or not_found:
+                cache[slug] = {"ts": time.time(), "price": price}
+            if price:
+                for muni_id in muni_ids:
+                    prices[muni_id] = price
+            done += 1
+            if done % 50 == 0:
+                save_prices(prices, out_path)
+                print(f"  Progress: {done}/{len(to_fetch)} slugs "
+                      f"({len(prices)} municipalities with prices)")
+
+        await asyncio.gather(
+            *(bounded_fetch(slug, ids) for slug, ids in to_fetch.items())
+        )
+
+    return prices
+
+
+def fetch_prices_blocking(municipalities, cache, prices, out_path):
+    """Serial fallback when aiohttp is unavailable."""
+    by_slug = {}  # slug → price (avoids duplicate GETs for shared names)
 
     for i, m in enumerate(municipalities):
         if i > 0 and i % 50 == 0:
-            print(f"  Progress: {i}/{len(municipalities)} ({success} found, {errors} missing)")
+            save_prices(prices, out_path)
+            print(f"  Progress: {i}/{len(municipalities)} "
+                  f"({len(prices)} found)")
 
-        price = fetch_price_for_municipality(m["name"])
+        slug = slugify(m["name"])
+        if slug in by_slug:
+            price = by_slug[slug]
+        elif slug in cache:
+            price = by_slug[slug] = cache[slug].get("price")
+        else:
+            price, definitive = fetch_price_for_municipality(m["name"])
+            by_slug[slug] = price
+            # Same gate as the async path: cache served pages and 404s,
+            # never a network blip that exhausted its retries
+            if definitive:
+                cache[slug] = {"ts": time.time(), "price": price}
+            # Be polite - 0.5s between requests
+            time.sleep(POLITENESS_DELAY)
         if price:
             prices[m["id"]] = price
-            success += 1
-        else:
-            errors += 1
 
-        # Be polite - 0.5s between requests
-        time.sleep(0.5)
+    return prices
 
-    print(f"\nDone: {success} prices found, {errors} missing")
 
+def main():
+    parser = argparse.ArgumentParser(description="Fetch Homegate CHF/m2 prices")
+    parser.add_argument(
+        "--force-refresh",
+        action="store_true",
+        help="Ignore the on-disk price cache and re-fetch everything",
+    )
+    args = parser.parse_args()
+
+    # Load municipalities
+    with open(PROCESSED_DIR / "municipalities.json") as f:
+        municipalities = json.load(f)
+
+    # Resume from an earlier partial run: municipalities that already have a
+    # price in prices.json are skipped unless --force-refresh is given
     out_path = PROCESSED_DIR / "prices.json"
-    with open(out_path, "w") as f:
-        json.dump(prices, f, indent=2)
+    prices = {}
+    if out_path.exists() and not args.force_refresh:
+        with open(out_path) as f:
+            prices = json.load(f)
+
+    todo = [m for m in municipalities if m["id"] not in prices]
+    if len(todo) < len(municipalities):
+        print(f"  {len(municipalities) - len(todo)} municipalities already "
+              f"priced; fetching {len(todo)}")
+    print(f"Fetching prices for {len(todo)} municipalities...")
+
+    cache = load_price_cache(force_refresh=args.force_refresh)
+    if aiohttp is not None:
+        prices = asyncio.run(fetch_prices_async(todo, cache, prices, out_path))
+    else:
+        prices = fetch_prices_blocking(todo, cache, prices, out_path)
+    save_price_cache(cache)
+
+    success = len(prices)
+    errors = len(municipalities) - success
+    print(f"\nDone: {success} prices found, {errors} missing")
+
+    save_prices(prices, out_path)
     print(f"Saved to {out_path}")
 
 
@@ -12,58 +12,147 @@ Strategy:
   3. Match slugs to our municipality BFS IDs
   4. Output: data/processed/prices_neho.json → copied to prices.json
 
-Resumable: saves progress every 25 pages. Re-run to continue.
+Pages are fetched by a pool of async workers (one Playwright page each)
+so network/render latency overlaps; per-worker jittered delays keep the
+aggregate request rate polite. Resumable: saves progress every 25 pages.
+Re-run to continue.
 """
+import asyncio
 import json
+import os
+import random
 import re
+import statistics
 import sys
 import time
 import xml.etree.ElementTree as ET
 from pathlib import Path
 
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from _neho_driver import (
+    CF_STATE_PATH,
+    LAUNCH_ARGS,
+    ROTATE_EVERY,
+    USER_AGENT,
+    WARMUP_URL,
+    new_async_context,
+)
 from config import PROCESSED_DIR
 
 SITEMAP_URL = "https://neho.ch/sitemap/seo/price"
-DELAY = 1.0  # seconds between pages — be polite to avoid Cloudflare blocks
+SITEMAP_CACHE = PROCESSED_DIR / "neho_sitemap_urls.json"
+SITEMAP_CACHE_TTL = 7 * 86400  # Neho updates roughly monthly
+DELAY = 1.0  # per-worker floor between pages — be polite to avoid Cloudflare blocks
+DELAY_CAP = 30.0  # ceiling for the adaptive backoff
 SAVE_EVERY = 25
 MAX_RETRIES = 2
+WORKERS = 8  # concurrent Playwright pages (one per worker)
+
+# Pooled session for the static-first happy path: most Neho price pages
+# are server-rendered, so a plain GET with a browser UA usually works and
+# the browser is only needed when Cloudflare interferes
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=WORKERS,
+                                      pool_maxsize=WORKERS))
+SESSION.headers.update({"User-Agent": USER_AGENT})
+
+
+# Compiled once — these helpers run for every fetched page
+_RE_INT = re.compile(r"\d+")
+_RE_CHF = re.compile(r"CHF\s+([\d'’]+)")
+# Drops apostrophes and spaces in one pass so "19'265" scans as one int
+_STRIP = str.maketrans("", "", "' ’")
+_RE_PAREN = re.compile(r"\s*\(.*?\)")
+_RE_DASHES = re.compile(r"-+")
+_RE_SAFE = re.compile(r"[^a-z0-9-]")
+# One translate pass instead of 14 chained .replace() calls
+_DIACRITICS = str.maketrans({
+    "ä": "ae", "ö": "oe", "ü": "ue",
+    "à": "a", "â": "a", "é": "e", "è": "e",
+    "ê": "e", "ë": "e", "ô": "o", "î": "i",
+    "ï": "i", "û": "u", "ù": "u", "ç": "c",
+})
 
 
 def parse_chf(text):
     """Parse "CHF 19'265" → 19265."""
     if not text:
         return None
-    cleaned = text.replace("CHF", "").strip()
-    cleaned = cleaned.replace("'", "").replace("\u2019", "").replace(" ", "")
-    match = re.search(r"(\d+)", cleaned)
-    return int(match.group(1)) if match else None
+    match = _RE_INT.search(text.translate(_STRIP))
+    return int(match.group()) if match else None
 
 
-def extract_prices_from_page(page):
-    """Extract price data from a loaded Neho page."""
-    def safe_text(selector):
-        el = page.query_selector(selector)
-        return el.text_content().strip() if el else None
+def parse_range(text):
+    nums = _RE_INT.findall(text.translate(_STRIP))
+    return (int(nums[0]), int(nums[1])) if len(nums) >= 2 else (None, None)
+
+
+# All five text fields in one JS round-trip: each query_selector +
+# text_content pair is a separate CDP call otherwise
+PRICE_FIELDS_JS = """() => {
+    const q = s => document.querySelector(s)?.textContent?.trim() || null;
+    return {
+        apt: q('.js-priceAverageApartments'),
+        house: q('.js-priceAverageHouses'),
+        info: q('.js-pageSearchInfo'),
+        range_apt: q('.js-priceRangeApartments'),
+        range_house: q('.js-priceRangeHouses'),
+    };
+}"""
+
+
+# Per-field patterns for server-rendered HTML (static happy path)
+_RE_STATIC = {
+    key: re.compile(r'class="[^"]*' + cls + r'[^"]*"[^>]*>([^<]+)<')
+    for key, cls in (
+        ("apt", "js-priceAverageApartments"),
+        ("house", "js-priceAverageHouses"),
+        ("info", "js-pageSearchInfo"),
+        ("range_apt", "js-priceRangeApartments"),
+        ("range_house", "js-priceRangeHouses"),
+    )
+}
+
+
+def fetch_static(url):
+    """GET a price page without the browser; None means escalate."""
+    try:
+        resp = SESSION.get(url, timeout=15)
+    except requests.RequestException:
+        return None
+    if resp.status_code == 200 and "js-priceAverage" in resp.text:
+        return resp.text
+    return None
 
-    avg_apt = parse_chf(safe_text(".js-priceAverageApartments"))
-    avg_house = parse_chf(safe_text(".js-priceAverageHouses"))
+
+def extract_prices_from_html(html):
+    """Parse price fields out of server-rendered HTML."""
+    data = {}
+    for key, pat in _RE_STATIC.items():
+        m = pat.search(html)
+        data[key] = m.group(1).strip() if m else None
+    return prices_from_fields(data)
+
+
+def prices_from_fields(data):
+    """Build the price record from the raw field texts (or None)."""
+    avg_apt = parse_chf(data["apt"])
+    avg_house = parse_chf(data["house"])
 
     # Overall average from info paragraph
-    info = safe_text(".js-pageSearchInfo") or ""
-    m = re.search(r"CHF\s+([\d'\u2019]+)", info)
+    m = _RE_CHF.search(data["info"] or "")
     avg_overall = parse_chf(m.group(1)) if m else None
 
     # Range data
-    range_apt = safe_text(".js-priceRangeApartments") or ""
-    range_house = safe_text(".js-priceRangeHouses") or ""
-
-    def parse_range(text):
-        nums = re.findall(r"[\d'\u2019]+", text)
-        parsed = [int(n.replace("'", "").replace("\u2019", "")) for n in nums if n.replace("'", "").replace("\u2019", "").isdigit()]
-        return (parsed[0], parsed[1]) if len(parsed) >= 2 else (None, None)
-
-    min_apt, max_apt = parse_range(range_apt)
-    min_house, max_house = parse_range(range_house)
+    min_apt, max_apt = parse_range(data["range_apt"] or "")
+    min_house, max_house = parse_range(data["range_house"] or "")
 
     primary = avg_apt or avg_house or avg_overall
     if primary is None:
@@ -82,6 +171,46 @@ def extract_prices_from_page(page):
     }
 
 
+async def extract_prices_from_page(page):
+    """Extract price data from a loaded Neho page."""
+    return prices_from_fields(await page.evaluate(PRICE_FIELDS_JS))
+
+
+def load_json(path):
+    """Load a JSON file, with orjson when available."""
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dump_json(obj, path, indent=False):
+    """Write a JSON file atomically, with orjson when available.
+
+    The price dict gets rewritten every SAVE_EVERY pages, so dump speed
+    adds up; indent only for the final human-readable outputs.
+    """
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        tmp.write_bytes(orjson.dumps(obj, option=option))
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=2 if indent else None, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def save_checkpoint(path, data, dirty=True):
+    """Write a progress file atomically; no-op if nothing changed.
+
+    Checkpoints are unindented — at thousands of entries the pretty dump
+    is ~3× the bytes for a file nobody reads.
+    """
+    if not dirty:
+        return
+    dump_json(data, path)
+
+
 def slug_from_url(url):
     """Extract slug from Neho URL: .../quadratmeterpreis-zuerich → zuerich"""
     return url.rsplit("/", 1)[-1].replace("quadratmeterpreis-", "")
@@ -89,32 +218,127 @@ def slug_from_url(url):
 
 def normalize_for_match(name):
     """Normalize a Swiss municipality name for matching to Neho slugs."""
-    n = name.lower().strip()
-    n = n.replace("ä", "ae").replace("ö", "oe").replace("ü", "ue")
-    n = n.replace("à", "a").replace("â", "a").replace("é", "e").replace("è", "e")
-    n = n.replace("ê", "e").replace("ë", "e").replace("ô", "o").replace("î", "i")
-    n = n.replace("ï", "i").replace("û", "u").replace("ù", "u").replace("ç", "c")
-    n = re.sub(r"\s*\(.*?\)", "", n)  # remove (BE), (ZH) etc
+    n = name.lower().strip().translate(_DIACRITICS)
+    n = _RE_PAREN.sub("", n)  # remove (BE), (ZH) etc
     n = n.replace(" ", "-").replace("/", "-").replace(".", "-").replace("'", "-")
-    n = re.sub(r"-+", "-", n).strip("-")
-    n = re.sub(r"[^a-z0-9-]", "", n)
+    n = _RE_DASHES.sub("-", n).strip("-")
+    n = _RE_SAFE.sub("", n)
     return n
 
 
-def main():
-    from playwright.sync_api import sync_playwright
+# Municipality-level German pages only: the lookaheads reject kanton
+# aggregates and postal-code pages ("...-8001-1") inside the match itself,
+# so no separate filter pass over the URL list is needed
+_RE_MUNI_URL = re.compile(
+    r"https://neho\.ch/de/quadratmeterpreis-"
+    r"(?!(?:[a-z0-9-]*-)?kanton)"
+    r"(?![a-z0-9-]*-\d{4}-\d+(?![a-z0-9-]))"
+    r"[a-z0-9-]+"
+)
+
+
+def fetch_sitemap_via_http():
+    """Stream-parse the sitemap over plain HTTP — no browser needed.
+
+    The sitemap is static XML with no JS rendering, so a direct GET is
+    both faster and invisible to Cloudflare's browser checks. iterparse
+    yields <loc> entries as the response streams in, so the document is
+    never fully buffered. Returns None if the plain request is refused
+    (caller falls back to Playwright).
+    """
+    urls = []
+    try:
+        with requests.get(SITEMAP_URL, headers={"User-Agent": USER_AGENT},
+                          timeout=30, stream=True) as resp:
+            if resp.status_code != 200:
+                return None
+            resp.raw.decode_content = True  # transparently gunzip
+            for _, elem in ET.iterparse(resp.raw, events=("end",)):
+                if elem.tag.endswith("loc") and elem.text:
+                    urls.append(elem.text.strip())
+                elem.clear()
+    except (requests.RequestException, ET.ParseError):
+        return None
+    return urls or None
+
+
+async def fetch_sitemap_urls(page, municipalities):
+    """Get municipality page URLs from the Neho sitemap (with fallbacks)."""
+    # The URL list changes ~monthly, the script re-runs often (resumable),
+    # so a week-old cached list skips the whole sitemap round-trip
+    if (SITEMAP_CACHE.exists()
+            and time.time() - SITEMAP_CACHE.stat().st_mtime < SITEMAP_CACHE_TTL):
+        cached = load_json(SITEMAP_CACHE)
+        print(f"  Using cached sitemap URL list ({len(cached)} URLs)")
+        return cached
+
+    print("Fetching sitemap...")
+    sys.stdout.flush()
+
+    urls = fetch_sitemap_via_http()
+    sitemap_text = None
+    if urls is None:
+        # Cloudflare refused the plain GET — fall back to the browser
+        print("  Plain HTTP blocked, fetching sitemap via browser...")
+        sys.stdout.flush()
+        try:
+            await page.goto(SITEMAP_URL, timeout=30000)
+            # The browser renders XML as HTML — extract the raw text
+            sitemap_text = await page.evaluate(
+                "document.querySelector('body')?.innerText || document.documentElement.outerHTML"
+            )
+        except Exception as e:
+            print(f"Sitemap fetch failed: {e}")
+            print("Falling back to constructing URLs from municipality names...")
+
+    urls = urls or []
+    if not urls and sitemap_text and "<loc>" in sitemap_text:
+        # Parse as XML if we got raw sitemap
+        try:
+            root = ET.fromstring(sitemap_text)
+            ns = {"sm": "http://www.sitemaps.org/schemas/sitemap/0.9"}
+            for loc in root.findall(".//sm:url/sm:loc", ns):
+                urls.append(loc.text.strip())
+        except ET.ParseError:
+            pass
+
+    if not urls:
+        # Fallback: one pass over the rendered page text — the pattern
+        # already excludes non-municipality pages, and dict.fromkeys
+        # dedupes while preserving sitemap order
+        urls = list(dict.fromkeys(_RE_MUNI_URL.findall(sitemap_text or "")))
+
+    if urls:
+        # Filter to municipality-level German pages
+        urls = [u for u in urls if _RE_MUNI_URL.fullmatch(u)]
+        print(f"  Got {len(urls)} municipality URLs from sitemap")
+        dump_json(urls, SITEMAP_CACHE)
+    else:
+        # Fallback: construct from municipality names
+        print("  Constructing URLs from municipality names...")
+        seen_slugs = set()
+        for m in municipalities:
+            slug = normalize_for_match(m["name"])
+            if slug not in seen_slugs:
+                urls.append(f"https://neho.ch/de/quadratmeterpreis-{slug}")
+                seen_slugs.add(slug)
+        print(f"  Generated {len(urls)} URLs")
+
+    return urls
+
+
+async def async_main():
+    from playwright.async_api import async_playwright
 
     # Load our municipalities
-    with open(PROCESSED_DIR / "municipalities.json") as f:
-        municipalities = json.load(f)
+    municipalities = load_json(PROCESSED_DIR / "municipalities.json")
     print(f"Loaded {len(municipalities)} municipalities")
 
     # Load existing prices for resume
     prices_path = PROCESSED_DIR / "prices_neho.json"
     existing = {}
     if prices_path.exists():
-        with open(prices_path) as f:
-            existing = json.load(f)
+        existing = load_json(prices_path)
         print(f"Resuming: {len(existing)} already fetched")
 
     # Build matching: normalized_name → [municipalities]
@@ -125,203 +349,208 @@ def main():
 
     sys.stdout.flush()
 
-    with sync_playwright() as p:
+    async with async_playwright() as p:
         # Launch with headed=False but with full browser args to pass Cloudflare
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--disable-features=IsolateOrigins,site-per-process",
-            ],
+        browser = await p.chromium.launch(headless=True, args=LAUNCH_ARGS)
+        # Reuse CF clearance from a previous run if we have it
+        context = await new_async_context(
+            browser,
+            storage_state=str(CF_STATE_PATH) if CF_STATE_PATH.exists() else None,
         )
-        context = browser.new_context(
-            user_agent=(
-                "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/122.0.0.0 Safari/537.36"
-            ),
-            locale="de-CH",
-            viewport={"width": 1280, "height": 720},
-        )
-        # Remove webdriver flag
-        context.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        page = context.new_page()
+        page = await context.new_page()
 
         # Step 1: Get URLs from sitemap
-        print("Fetching sitemap via browser...")
-        sys.stdout.flush()
-        try:
-            page.goto(SITEMAP_URL, timeout=30000)
-            sitemap_text = page.content()
-            # The browser renders XML as HTML — extract the raw text
-            sitemap_text = page.evaluate("document.querySelector('body')?.innerText || document.documentElement.outerHTML")
-        except Exception as e:
-            print(f"Sitemap fetch failed: {e}")
-            print("Falling back to constructing URLs from municipality names...")
-            sitemap_text = None
-
-        urls = []
-        if sitemap_text and "<loc>" in sitemap_text:
-            # Parse as XML if we got raw sitemap
-            try:
-                root = ET.fromstring(sitemap_text)
-                ns = {"sm": "http://www.sitemaps.org/schemas/sitemap/0.9"}
-                for loc in root.findall(".//sm:url/sm:loc", ns):
-                    urls.append(loc.text.strip())
-            except ET.ParseError:
-                pass
-
-        if not urls:
-            # Try extracting URLs from rendered page text
-            found = re.findall(r"https://neho\.ch/de/quadratmeterpreis-[a-z0-9-]+", sitemap_text or "")
-            urls = list(set(found))
-
-        if urls:
-            # Filter to municipality-level German pages
-            urls = [u for u in urls
-                    if "/de/quadratmeterpreis-" in u
-                    and "-kanton" not in u
-                    and not re.search(r"-\d{4}-\d+$", u)]
-            print(f"  Got {len(urls)} municipality URLs from sitemap")
-        else:
-            # Fallback: construct from municipality names
-            print("  Constructing URLs from municipality names...")
-            seen_slugs = set()
-            for m in municipalities:
-                slug = normalize_for_match(m["name"])
-                if slug not in seen_slugs:
-                    urls.append(f"https://neho.ch/de/quadratmeterpreis-{slug}")
-                    seen_slugs.add(slug)
-            print(f"  Generated {len(urls)} URLs")
+        urls = await fetch_sitemap_urls(page, municipalities)
 
         # Filter out already-fetched URLs
-        already_done = set()
-        for slug, munis in name_to_munis.items():
-            if any(m["id"] in existing for m in munis):
-                already_done.add(slug)
-
-        remaining_urls = []
-        for url in urls:
-            slug = slug_from_url(url)
-            if slug not in already_done:
-                remaining_urls.append(url)
-
-        print(f"  {len(remaining_urls)} remaining to fetch")
+        existing_ids = set(existing)
+        already_done = {slug for slug, munis in name_to_munis.items()
+                        if any(m["id"] in existing_ids for m in munis)}
+        # Slug each URL once here; workers consume ready-made pairs
+        pairs = ((slug_from_url(u), u) for u in urls)
+        remaining = [(s, u) for s, u in pairs if s not in already_done]
+
+        print(f"  {len(remaining)} remaining to fetch")
         sys.stdout.flush()
 
-        if not remaining_urls:
+        if not remaining:
             print("All done!")
-            browser.close()
+            await browser.close()
             return
 
-        # Step 2: Fetch each page
-        # First, visit the homepage to get cookies/CF clearance
+        # Step 2: Fetch each page with a pool of workers.
+        # First, visit the homepage to get cookies/CF clearance (the CF
+        # cookie lives on the context, so one warmup covers all pages)
         print("Warming up browser session...")
         try:
-            page.goto("https://neho.ch/de/immobilienpreise-schweiz", timeout=20000, wait_until="domcontentloaded")
-            time.sleep(2)
+            await page.goto(WARMUP_URL, timeout=20000,
+                            wait_until="domcontentloaded")
+            await asyncio.sleep(2)
         except Exception:
             pass
 
-        success = 0
-        errors = 0
-        not_found = 0
-        blocked = 0
-        consecutive_errors = 0
-
-        for i, url in enumerate(remaining_urls):
-            slug = slug_from_url(url)
-            fetched = False
+        stats = {"success": 0, "errors": 0, "not_found": 0, "blocked": 0,
+                 "done": 0, "consecutive_errors": 0}
+        pending = {"dirty": False}  # new entries since last checkpoint?
+        # Adaptive pacing shared by all workers: decay towards the floor
+        # while the server answers 200, double on 403/5xx/timeouts
+        pace = {"delay": DELAY}
+        queue = asyncio.Queue()
+        for pair in remaining:
+            queue.put_nowait(pair)
+
+        def record(slug, prices):
+            # Match slug to municipalities
+            matched = name_to_munis.get(slug, [])
+            if matched:
+                for m in matched:
+                    existing[m["id"]] = prices
+            else:
+                # Store by slug for later matching
+                existing[f"_slug_{slug}"] = prices
+            pending["dirty"] = True
+            stats["success"] += 1
+            stats["consecutive_errors"] = 0
+
+        async def fetch_one(worker_page, url, slug):
+            # Happy path first: server-rendered pages parse from a plain
+            # pooled GET, no browser render needed
+            html = await asyncio.to_thread(fetch_static, url)
+            if html:
+                prices = extract_prices_from_html(html)
+                if prices:
+                    pace["delay"] = max(DELAY, pace["delay"] * 0.9)
+                    record(slug, prices)
+                    return
 
             for attempt in range(MAX_RETRIES + 1):
                 try:
-                    resp = page.goto(url, timeout=20000, wait_until="domcontentloaded")
+                    resp = await worker_page.goto(url, timeout=20000,
+                                                  wait_until="domcontentloaded")
                     status = resp.status if resp else 0
 
                     if status == 404:
-                        not_found += 1
-                        consecutive_errors = 0
-                        fetched = True
-                        break
+                        stats["not_found"] += 1
+                        stats["consecutive_errors"] = 0
+                        return
                     elif status == 403:
-                        blocked += 1
+                        pace["delay"] = min(DELAY_CAP, pace["delay"] * 2)
                         if attempt < MAX_RETRIES:
-                            time.sleep(3 * (attempt + 1))
+                            await asyncio.sleep(pace["delay"])
                             continue
-                        fetched = True
-                        break
+                        stats["blocked"] += 1
+                        return
                     elif status == 200:
-                        # Check if we got a Cloudflare challenge page
-                        title = page.title()
-                        if "just a moment" in title.lower() or "cloudflare" in title.lower():
-                            # Wait for challenge to resolve
-                            time.sleep(5)
-                            page.wait_for_load_state("domcontentloaded", timeout=10000)
-
-                        prices = extract_prices_from_page(page)
+                        pace["delay"] = max(DELAY, pace["delay"] * 0.9)
+                        # One probe covers both "content rendered" and "this is
+                        # the CF interstitial" — cheaper than title() + scans
+                        if not await worker_page.evaluate(
+                                "!!document.querySelector('.js-priceAverageApartments')"):
+                            try:
+                                await worker_page.wait_for_selector(
+                                    ".js-priceAverageApartments", timeout=10000)
+                            except Exception:
+                                pass  # page may legitimately lack this field
+
+                        prices = await extract_prices_from_page(worker_page)
                         if prices:
-                            # Match slug to municipalities
-                            matched = name_to_munis.get(slug, [])
-                            if matched:
-                                for m in matched:
-                                    existing[m["id"]] = prices
-                            else:
-                                # Store by slug for later matching
-                                existing[f"_slug_{slug}"] = prices
-                            success += 1
-                            consecutive_errors = 0
+                            record(slug, prices)
                         else:
-                            errors += 1
-                        fetched = True
-                        break
+                            stats["errors"] += 1
+                        return
                     else:
-                        errors += 1
-                        fetched = True
-                        break
+                        pace["delay"] = min(DELAY_CAP, pace["delay"] * 2)
+                        stats["errors"] += 1
+                        return
 
-                except Exception as e:
+                except Exception:
+                    pace["delay"] = min(DELAY_CAP, pace["delay"] * 2)
                     if attempt < MAX_RETRIES:
-                        time.sleep(2 * (attempt + 1))
+                        await asyncio.sleep(pace["delay"])
                         continue
-                    errors += 1
-                    consecutive_errors += 1
-                    fetched = True
-                    break
-
-            # If too many consecutive errors, take a longer break
-            if consecutive_errors >= 10:
-                print(f"  10 consecutive errors — pausing 30s...")
-                sys.stdout.flush()
-                time.sleep(30)
-                consecutive_errors = 0
-                # Refresh session
-                try:
-                    page.goto("https://neho.ch/de/immobilienpreise-schweiz", timeout=20000, wait_until="domcontentloaded")
-                    time.sleep(3)
-                except Exception:
-                    pass
+                    stats["errors"] += 1
+                    stats["consecutive_errors"] += 1
+                    return
 
-            total_done = i + 1
-            if total_done % SAVE_EVERY == 0 or total_done == len(remaining_urls):
-                print(f"  Progress: {total_done}/{len(remaining_urls)} "
-                      f"({success} ok, {not_found} 404, {blocked} blocked, {errors} err)")
-                sys.stdout.flush()
-                with open(prices_path, "w") as f:
-                    json.dump(existing, f, indent=2, ensure_ascii=False)
+        # Contexts are recycled every ROTATE_EVERY pages (see new_async_context);
+        # each round's budget is shared by all workers of that round
+        budget = {"left": ROTATE_EVERY}
 
-            time.sleep(DELAY)
+        async def worker(worker_page):
+            while budget["left"] > 0:
+                try:
+                    slug, url = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                budget["left"] -= 1
+                await fetch_one(worker_page, url, slug)
+
+                # If too many consecutive errors, all workers drain through
+                # this pause before hammering Cloudflare further
+                if stats["consecutive_errors"] >= 10:
+                    print("  10 consecutive errors — pausing 30s...")
+                    sys.stdout.flush()
+                    stats["consecutive_errors"] = 0
+                    await asyncio.sleep(30)
+                    # Refresh session
+                    try:
+                        await worker_page.goto(WARMUP_URL, timeout=20000,
+                                               wait_until="domcontentloaded")
+                        await asyncio.sleep(3)
+                    except Exception:
+                        pass
+
+                stats["done"] += 1
+                if stats["done"] % SAVE_EVERY == 0 or stats["done"] == len(remaining):
+                    print(f"  Progress: {stats['done']}/{len(remaining)} "
+                          f"({stats['success']} ok, {stats['not_found']} 404, "
+                          f"{stats['blocked']} blocked, {stats['errors']} err)")
+                    sys.stdout.flush()
+                    save_checkpoint(prices_path, existing, pending["dirty"])
+                    pending["dirty"] = False
+
+                # Jittered so the workers don't synchronize into bursts
+                await asyncio.sleep(pace["delay"] + random.uniform(0, 0.25))
+
+        # One page per worker; re-use the warmup page for the first worker.
+        # Between rounds the context is torn down and rebuilt from its own
+        # storage state, which keeps RSS flat without losing CF clearance.
+        while True:
+            pages = [page]
+            for _ in range(min(WORKERS, queue.qsize()) - 1):
+                pages.append(await context.new_page())
+            budget["left"] = ROTATE_EVERY
+            await asyncio.gather(*(worker(pg) for pg in pages))
+            if queue.empty():
+                break
+
+            storage = await context.storage_state()
+            await context.close()
+            context = await new_async_context(browser, storage_state=storage)
+            page = await context.new_page()
+            try:
+                await page.goto(WARMUP_URL, timeout=20000,
+                                wait_until="domcontentloaded")
+                await asyncio.sleep(2)
+            except Exception:
+                pass
 
-        browser.close()
+        # Persist the clearance cookies for the sweep script / next run
+        try:
+            await context.storage_state(path=str(CF_STATE_PATH))
+        except Exception:
+            pass
+        await browser.close()
 
     # Final save
-    with open(prices_path, "w") as f:
-        json.dump(existing, f, indent=2, ensure_ascii=False)
+    dump_json(existing, prices_path, indent=True)
 
     # Count real municipality matches (exclude _slug_ entries)
     real_prices = {k: v for k, v in existing.items() if not k.startswith("_slug_")}
     slug_only = {k: v for k, v in existing.items() if k.startswith("_slug_")}
 
-    print(f"\nDone: {success} fetched, {not_found} not found, {blocked} blocked, {errors} errors")
+    print(f"\nDone: {stats['success']} fetched, {stats['not_found']} not found, "
+          f"{stats['blocked']} blocked, {stats['errors']} errors")
     print(f"Matched to BFS IDs: {len(real_prices)}/{len(municipalities)}")
     if slug_only:
         print(f"Unmatched (stored by slug): {len(slug_only)}")
@@ -329,15 +558,18 @@ def main():
     # Copy to prices.json if we have enough data
     if len(real_prices) > 500:
         final_path = PROCESSED_DIR / "prices.json"
-        with open(final_path, "w") as f:
-            json.dump(real_prices, f, indent=2, ensure_ascii=False)
+        dump_json(real_prices, final_path, indent=True)
         print(f"Saved {len(real_prices)} prices to {final_path}")
     else:
         print(f"Only {len(real_prices)} matches — not overwriting prices.json (need >500)")
 
     vals = [v["chf_per_m2"] for v in real_prices.values() if v.get("chf_per_m2")]
     if vals:
-        print(f"  CHF/m²: min={min(vals)}, max={max(vals)}, median={sorted(vals)[len(vals)//2]}")
+        print(f"  CHF/m²: min={min(vals)}, max={max(vals)}, median={statistics.median(vals)}")
+
+
+def main():
+    asyncio.run(async_main())
 
 
 if __name__ == "__main__":
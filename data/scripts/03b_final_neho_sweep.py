@@ -5,39 +5,74 @@ Chrome profile + stealth. Dismisses cookie banner. Classifies results
 precisely: price found / "Nicht genug Daten" / 404 / error.
 """
 import json
+import os
 import random
 import re
+import statistics
 import sys
 import time
-from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from _neho_driver import CF_STATE_PATH, neho_context
 from config import PROCESSED_DIR
 
 DELAY_MIN = 1.5
-DELAY_MAX = 3.5
+DELAY_CAP = 30.0  # ceiling for the adaptive backoff
 SAVE_EVERY = 25
 
 
+# Compiled once \u2014 same helper hot path as 03b_fetch_prices_neho
+_RE_INT = re.compile(r"\d+")
+_RE_CHF = re.compile(r"CHF\s+([\d'\u2019]+)")
+_STRIP = str.maketrans("", "", "' \u2019")
+_RE_PAREN = re.compile(r"\s*\(.*?\)")
+_RE_DASHES = re.compile(r"-+")
+_RE_SAFE = re.compile(r"[^a-z0-9-]")
+_DIACRITICS = str.maketrans({
+    "\u00e4": "ae", "\u00f6": "oe", "\u00fc": "ue",
+    "\u00e0": "a", "\u00e2": "a", "\u00e9": "e", "\u00e8": "e",
+    "\u00ea": "e", "\u00eb": "e", "\u00f4": "o", "\u00ee": "i",
+    "\u00ef": "i", "\u00fb": "u", "\u00f9": "u", "\u00e7": "c",
+})
+
+
 def parse_chf(text):
     if not text:
         return None
-    cleaned = text.replace("CHF", "").strip()
-    cleaned = cleaned.replace("'", "").replace("\u2019", "").replace(" ", "")
-    match = re.search(r"(\d+)", cleaned)
-    val = int(match.group(1)) if match else None
+    match = _RE_INT.search(text.translate(_STRIP))
+    val = int(match.group()) if match else None
     # Filter out placeholder values
     if val is not None and val <= 0:
         return None
     return val
 
 
-def extract_prices_from_page(page):
-    def safe_text(selector):
-        el = page.query_selector(selector)
-        return el.text_content().strip() if el else None
+# Same one-round-trip field grab as 03b_fetch_prices_neho
+PRICE_FIELDS_JS = """() => {
+    const q = s => document.querySelector(s)?.textContent?.trim() || null;
+    return {
+        apt: q('.js-priceAverageApartments'),
+        house: q('.js-priceAverageHouses'),
+        info: q('.js-pageSearchInfo'),
+        range_apt: q('.js-priceRangeApartments'),
+        range_house: q('.js-priceRangeHouses'),
+    };
+}"""
+
 
-    apt_text = safe_text(".js-priceAverageApartments") or ""
-    house_text = safe_text(".js-priceAverageHouses") or ""
+def parse_range(text):
+    nums = _RE_INT.findall(text.translate(_STRIP))
+    return (int(nums[0]), int(nums[1])) if len(nums) >= 2 else (None, None)
+
+
+def extract_prices_from_page(page):
+    data = page.evaluate(PRICE_FIELDS_JS)
+    apt_text = data["apt"] or ""
+    house_text = data["house"] or ""
 
     # Check for "Nicht genug Daten"
     if "nicht genug" in apt_text.lower() and "nicht genug" in house_text.lower():
@@ -46,21 +81,11 @@ def extract_prices_from_page(page):
     avg_apt = parse_chf(apt_text)
     avg_house = parse_chf(house_text)
 
-    info = safe_text(".js-pageSearchInfo") or ""
-    m = re.search(r"CHF\s+([\d'\u2019]+)", info)
+    m = _RE_CHF.search(data["info"] or "")
     avg_overall = parse_chf(m.group(1)) if m else None
 
-    range_apt = safe_text(".js-priceRangeApartments") or ""
-    range_house = safe_text(".js-priceRangeHouses") or ""
-
-    def parse_range(text):
-        nums = re.findall(r"[\d'\u2019]+", text)
-        parsed = [int(n.replace("'", "").replace("\u2019", ""))
-                  for n in nums if n.replace("'", "").replace("\u2019", "").isdigit()]
-        return (parsed[0], parsed[1]) if len(parsed) >= 2 else (None, None)
-
-    min_apt, max_apt = parse_range(range_apt)
-    min_house, max_house = parse_range(range_house)
+    min_apt, max_apt = parse_range(data["range_apt"] or "")
+    min_house, max_house = parse_range(data["range_house"] or "")
 
     primary = avg_apt or avg_house or avg_overall
     if primary is None:
@@ -79,21 +104,42 @@ def extract_prices_from_page(page):
     }
 
 
+def load_json(path):
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dump_json(obj, path, indent=False):
+    """Atomic JSON write, orjson-accelerated when available."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        tmp.write_bytes(orjson.dumps(obj, option=option))
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=2 if indent else None, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def save_checkpoint(path, data, dirty=True):
+    """Atomic, unindented progress write; skipped when nothing changed."""
+    if not dirty:
+        return
+    dump_json(data, path)
+
+
 def normalize(name):
-    n = name.lower().strip()
-    n = n.replace("ä", "ae").replace("ö", "oe").replace("ü", "ue")
-    n = n.replace("à", "a").replace("â", "a").replace("é", "e").replace("è", "e")
-    n = n.replace("ê", "e").replace("ë", "e").replace("ô", "o").replace("î", "i")
-    n = n.replace("ï", "i").replace("û", "u").replace("ù", "u").replace("ç", "c")
-    n = re.sub(r"\s*\(.*?\)", "", n)
+    n = name.lower().strip().translate(_DIACRITICS)
+    n = _RE_PAREN.sub("", n)
     n = n.replace(" ", "-").replace("/", "-").replace(".", "-").replace("'", "-")
-    n = re.sub(r"-+", "-", n).strip("-")
-    n = re.sub(r"[^a-z0-9-]", "", n)
+    n = _RE_DASHES.sub("-", n).strip("-")
+    n = _RE_SAFE.sub("", n)
     return n
 
 
 def main():
-    from playwright.sync_api import sync_playwright
     from playwright_stealth import Stealth
 
     stealth = Stealth(
@@ -101,12 +147,9 @@ def main():
         navigator_platform_override="MacIntel",
     )
 
-    with open(PROCESSED_DIR / "municipalities.json") as f:
-        municipalities = json.load(f)
-    with open(PROCESSED_DIR / "prices.json") as f:
-        current_prices = json.load(f)
-    with open(PROCESSED_DIR / "prices_neho.json") as f:
-        neho_raw = json.load(f)
+    municipalities = load_json(PROCESSED_DIR / "municipalities.json")
+    current_prices = load_json(PROCESSED_DIR / "prices.json")
+    neho_raw = load_json(PROCESSED_DIR / "prices_neho.json")
 
     all_munis = {m["id"]: m for m in municipalities}
     missing_ids = set(all_munis.keys()) - set(current_prices.keys())
@@ -128,36 +171,24 @@ def main():
         print("Nothing to fetch!")
         return
 
-    profile_dir = Path("/tmp/neho_chrome_final")
-    profile_dir.mkdir(parents=True, exist_ok=True)
-
-    with sync_playwright() as p:
-        context = p.chromium.launch_persistent_context(
-            user_data_dir=str(profile_dir),
+    # Shared browser policy + warmup live in _neho_driver; reuse the
+    # Cloudflare clearance earned by 03b_fetch_prices_neho when present
+    print("Warming up...")
+    sys.stdout.flush()
+    with neho_context(
+            storage_state=str(CF_STATE_PATH) if CF_STATE_PATH.exists() else None,
             headless=False,
             channel="chrome",
-            locale="de-CH",
-            viewport={"width": 1366, "height": 768},
-        )
-        page = context.pages[0] if context.pages else context.new_page()
-        stealth.apply_stealth_sync(page)
-
-        # Warm up + dismiss cookies
-        print("Warming up...")
-        sys.stdout.flush()
-        try:
-            page.goto("https://neho.ch/de/immobilienpreise-schweiz",
-                       timeout=30000, wait_until="domcontentloaded")
-            time.sleep(3)
-            for btn in page.query_selector_all("button"):
-                if "akzeptieren" in btn.text_content().strip().lower():
-                    btn.click()
-                    time.sleep(1)
-                    break
-        except Exception:
-            pass
-
+            stealth=stealth) as (context, page):
         stats = {"ok": 0, "no_data": 0, "404": 0, "cf_block": 0, "error": 0}
+        dirty = False
+        # Filter the _slug_ entries out once; kept in sync on every hit so
+        # checkpoints don't re-filter the whole dict
+        real_prices = {k: v for k, v in neho_raw.items()
+                       if not k.startswith("_slug_")}
+        # Adaptive pacing: decay towards the floor on 200, double on
+        # blocks/errors so the sweep backs off instead of getting banned
+        delay = DELAY_MIN
 
         for i, (slug, url) in enumerate(urls):
             try:
@@ -167,15 +198,23 @@ def main():
                 if status == 404:
                     stats["404"] += 1
                 elif status == 403:
+                    delay = min(DELAY_CAP, delay * 2)
                     stats["cf_block"] += 1
                 elif status == 200:
-                    title = page.title()
-                    if "just a moment" in title.lower() or "cloudflare" in title.lower():
-                        time.sleep(8)
-                        stats["cf_block"] += 1
-                        continue
-
-                    time.sleep(3)
+                    # Probe one selector instead of title(): confirms content
+                    # and rules out the CF interstitial in a single CDP call
+                    if not page.evaluate(
+                            "!!document.querySelector('.js-priceAverageApartments')"):
+                        try:
+                            page.wait_for_selector(".js-priceAverageApartments",
+                                                   timeout=10000)
+                        except Exception:
+                            delay = min(DELAY_CAP, delay * 2)
+                            stats["cf_block"] += 1
+                            time.sleep(delay + random.uniform(0, 0.25))
+                            continue
+
+                    delay = max(DELAY_MIN, delay * 0.9)
                     result = extract_prices_from_page(page)
 
                     if result == "no_data":
@@ -183,38 +222,35 @@ def main():
                     elif isinstance(result, dict):
                         for mid in slug_to_mids.get(slug, []):
                             neho_raw[mid] = result
+                            real_prices[mid] = result
                             current_prices[mid] = result
+                        dirty = True
                         stats["ok"] += 1
                     else:
                         stats["error"] += 1
                 else:
+                    delay = min(DELAY_CAP, delay * 2)
                     stats["error"] += 1
 
             except Exception:
+                delay = min(DELAY_CAP, delay * 2)
                 stats["error"] += 1
 
             done = i + 1
             if done % SAVE_EVERY == 0 or done == len(urls):
-                real = {k: v for k, v in neho_raw.items() if not k.startswith("_slug_")}
-                print(f"  {done}/{len(urls)}: {stats} | total prices: {len(real)}")
+                print(f"  {done}/{len(urls)}: {stats} | total prices: {len(real_prices)}")
                 sys.stdout.flush()
-                with open(PROCESSED_DIR / "prices_neho.json", "w") as f:
-                    json.dump(neho_raw, f, indent=2, ensure_ascii=False)
-                with open(PROCESSED_DIR / "prices.json", "w") as f:
-                    json.dump({k: v for k, v in neho_raw.items()
-                               if not k.startswith("_slug_")},
-                              f, indent=2, ensure_ascii=False)
-
-            time.sleep(random.uniform(DELAY_MIN, DELAY_MAX))
+                save_checkpoint(PROCESSED_DIR / "prices_neho.json", neho_raw, dirty)
+                save_checkpoint(PROCESSED_DIR / "prices.json", real_prices, dirty)
+                dirty = False
 
-        context.close()
+            time.sleep(delay + random.uniform(0, 0.25))
 
-    real = {k: v for k, v in neho_raw.items() if not k.startswith("_slug_")}
     print(f"\nFinal: {stats}")
-    print(f"Total BFS-matched prices: {len(real)}/{len(municipalities)}")
-    vals = [v["chf_per_m2"] for v in real.values() if v.get("chf_per_m2")]
+    print(f"Total BFS-matched prices: {len(real_prices)}/{len(municipalities)}")
+    vals = [v["chf_per_m2"] for v in real_prices.values() if v.get("chf_per_m2")]
     if vals:
-        print(f"CHF/m²: min={min(vals)}, max={max(vals)}, median={sorted(vals)[len(vals)//2]}")
+        print(f"CHF/m²: min={min(vals)}, max={max(vals)}, median={statistics.median(vals)}")
 
 
 if __name__ == "__main__":
@@ -3,53 +3,150 @@
 Retry Neho.ch scraping for municipalities that are still missing prices.
 
 Only fetches pages for the ~900 municipalities we don't yet have.
-Uses longer delays and periodic session refreshes to avoid Cloudflare.
+A static HTTP fast lane resolves server-rendered pages first; the rest
+go through a pool of async Playwright contexts sharing one browser, so
+several navigations stay in flight while each context keeps its own
+pacing and periodic refresh to avoid Cloudflare.
 """
+import asyncio
 import json
 import random
 import re
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+import requests
+from requests.adapters import HTTPAdapter
+
+from _neho_driver import block_assets_async
 from config import PROCESSED_DIR
 
-DELAY_MIN = 1.5
-DELAY_MAX = 3.0
 SAVE_EVERY = 25
 SESSION_REFRESH_EVERY = 75  # new browser context every N pages
+WORKERS = 4  # parallel scraper threads, one browser each
+FAST_WORKERS = 16  # threads for the static first pass (no browser)
+WARMUP_URL = "https://neho.ch/de/immobilienpreise-schweiz"
+# Append-only sidecar: one line per hit, replayed on resume after a crash
+JSONL_PATH = PROCESSED_DIR / "prices_neho.jsonl"
+# Slugs confirmed 404 on Neho; reruns skip them instead of re-navigating
+NOT_FOUND_PATH = PROCESSED_DIR / "neho_404.json"
+
+UA_VARIANTS = [
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+]
+
+# Pooled session for the static fast lane (UA rotated per request);
+# a plain GET is 20-50x cheaper than a Chromium navigation
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=FAST_WORKERS,
+                                      pool_maxsize=FAST_WORKERS))
+SESSION.headers.update({"Accept-Language": "de-CH,de;q=0.9"})
+
+
+class TokenBucket:
+    """Adaptive pacing: send as soon as a token is available.
+
+    The rate climbs while the server plays along and collapses after a
+    block, so the happy path never waits out a worst-case fixed delay
+    and a hot limiter slows us down before it bans us.
+    """
+
+    RATE_MIN = 0.1  # tokens/sec under pushback
+    RATE_MAX = 2.0  # tokens/sec ceiling while healthy
+
+    def __init__(self, rate=1.0):
+        self.rate = rate
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(1.0, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    async def acquire(self):
+        self._refill()
+        if self.tokens < 1.0:
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1.0
+
+    def on_success(self):
+        self.rate = min(self.RATE_MAX, self.rate * 1.2)
+
+    def on_block(self, retry_after=None):
+        self.rate = max(self.RATE_MIN, self.rate * 0.5)
+        self.tokens = 0.0
+        if retry_after:
+            try:
+                # Retry-After is authoritative: drain below zero so the
+                # next acquire waits it out on top of the refill
+                self.tokens = -min(120.0, float(retry_after)) * self.rate
+            except ValueError:
+                pass
+
+
+# Hot helpers run once per page \u2014 compile patterns a single time
+_RE_PRICE = re.compile(r"\d+")  # digit runs, after the translate pass
+_STRIP_APOS = str.maketrans("", "", "' \u2019")  # thousands separators
+_RE_CHF_INFO = re.compile(r"CHF\s+([\d'\u2019]+)")
+_RE_PAREN = re.compile(r"\s*\(.*?\)")
+_RE_DASHES = re.compile(r"-+")
+_RE_NONALNUM = re.compile(r"[^a-z0-9-]")
+# Swiss diacritics fold in a single translate pass
+_DIACRITICS = str.maketrans({
+    "\u00e4": "ae", "\u00f6": "oe", "\u00fc": "ue",
+    "\u00e0": "a", "\u00e2": "a", "\u00e9": "e", "\u00e8": "e",
+    "\u00ea": "e", "\u00eb": "e", "\u00f4": "o", "\u00ee": "i",
+    "\u00ef": "i", "\u00fb": "u", "\u00f9": "u", "\u00e7": "c",
+})
 
 
 def parse_chf(text):
+    """One translate pass then one scan \u2014 no per-token re-cleaning."""
     if not text:
         return None
-    cleaned = text.replace("CHF", "").strip()
-    cleaned = cleaned.replace("'", "").replace("\u2019", "").replace(" ", "")
-    match = re.search(r"(\d+)", cleaned)
-    return int(match.group(1)) if match else None
-
+    m = _RE_PRICE.search(text.translate(_STRIP_APOS))
+    return int(m.group(0)) if m else None
 
-def extract_prices_from_page(page):
-    def safe_text(selector):
-        el = page.query_selector(selector)
-        return el.text_content().strip() if el else None
 
-    avg_apt = parse_chf(safe_text(".js-priceAverageApartments"))
-    avg_house = parse_chf(safe_text(".js-priceAverageHouses"))
-    info = safe_text(".js-pageSearchInfo") or ""
-    m = re.search(r"CHF\s+([\d'\u2019]+)", info)
+# One evaluate round-trip for the five text fields instead of five
+# query_selector + text_content CDP hops
+PRICE_FIELDS_JS = """() => {
+    const q = s => document.querySelector(s)?.textContent?.trim() || null;
+    return {
+        apt: q('.js-priceAverageApartments'),
+        house: q('.js-priceAverageHouses'),
+        info: q('.js-pageSearchInfo'),
+        range_apt: q('.js-priceRangeApartments'),
+        range_house: q('.js-priceRangeHouses'),
+    };
+}"""
+
+
+def parse_range(text):
+    # Strip separators up front so each match is already a clean int;
+    # spaces go too, which keeps "CHF 8'000" a single number
+    nums = [int(m.group(0))
+            for m in _RE_PRICE.finditer(text.translate(_STRIP_APOS))]
+    return (nums[0], nums[1]) if len(nums) >= 2 else (None, None)
+
+
+def prices_from_fields(data):
+    """Build the price record from the raw field texts (or None)."""
+    avg_apt = parse_chf(data["apt"])
+    avg_house = parse_chf(data["house"])
+    m = _RE_CHF_INFO.search(data["info"] or "")
     avg_overall = parse_chf(m.group(1)) if m else None
 
-    range_apt = safe_text(".js-priceRangeApartments") or ""
-    range_house = safe_text(".js-priceRangeHouses") or ""
-
-    def parse_range(text):
-        nums = re.findall(r"[\d'\u2019]+", text)
-        parsed = [int(n.replace("'", "").replace("\u2019", "")) for n in nums if n.replace("'", "").replace("\u2019", "").isdigit()]
-        return (parsed[0], parsed[1]) if len(parsed) >= 2 else (None, None)
-
-    min_apt, max_apt = parse_range(range_apt)
-    min_house, max_house = parse_range(range_house)
+    min_apt, max_apt = parse_range(data["range_apt"] or "")
+    min_house, max_house = parse_range(data["range_house"] or "")
 
     primary = avg_apt or avg_house or avg_overall
     if primary is None:
@@ -68,40 +165,151 @@ def extract_prices_from_page(page):
     }
 
 
+async def extract_prices_from_page(page):
+    return prices_from_fields(await page.evaluate(PRICE_FIELDS_JS))
+
+
+# Per-field patterns for server-rendered HTML (static fast lane)
+_RE_STATIC = {
+    key: re.compile(r'class="[^"]*' + cls + r'[^"]*"[^>]*>([^<]+)<')
+    for key, cls in (
+        ("apt", "js-priceAverageApartments"),
+        ("house", "js-priceAverageHouses"),
+        ("info", "js-pageSearchInfo"),
+        ("range_apt", "js-priceRangeApartments"),
+        ("range_house", "js-priceRangeHouses"),
+    )
+}
+
+
+def fetch_fast(url):
+    """Try a plain GET before spending a browser navigation on the slug.
+
+    Returns ("ok", record), ("404", None), or ("needs_browser", None) when
+    Cloudflare pushes back or the fields are only filled in client-side.
+    """
+    try:
+        resp = SESSION.get(url, timeout=15,
+                           headers={"User-Agent": random.choice(UA_VARIANTS)})
+    except requests.RequestException:
+        return "needs_browser", None
+    if resp.status_code == 404:
+        return "404", None
+    if resp.status_code == 200 and "js-priceAverage" in resp.text:
+        data = {}
+        for key, pat in _RE_STATIC.items():
+            m = pat.search(resp.text)
+            data[key] = m.group(1).strip() if m else None
+        record = prices_from_fields(data)
+        if record:
+            return "ok", record
+    return "needs_browser", None
+
+
+@lru_cache(maxsize=4096)
 def normalize(name):
-    n = name.lower().strip()
-    n = n.replace("ä", "ae").replace("ö", "oe").replace("ü", "ue")
-    n = n.replace("à", "a").replace("â", "a").replace("é", "e").replace("è", "e")
-    n = n.replace("ê", "e").replace("ë", "e").replace("ô", "o").replace("î", "i")
-    n = n.replace("ï", "i").replace("û", "u").replace("ù", "u").replace("ç", "c")
-    n = re.sub(r"\s*\(.*?\)", "", n)
+    n = name.lower().strip().translate(_DIACRITICS)
+    n = _RE_PAREN.sub("", n)
     n = n.replace(" ", "-").replace("/", "-").replace(".", "-").replace("'", "-")
-    n = re.sub(r"-+", "-", n).strip("-")
-    n = re.sub(r"[^a-z0-9-]", "", n)
+    n = _RE_DASHES.sub("-", n).strip("-")
+    n = _RE_NONALNUM.sub("", n)
     return n
 
 
-def create_context(browser):
+def replay_jsonl(path, neho_raw, current_prices):
+    """Fold sidecar lines from a crashed run back into the price dicts."""
+    if not path.exists():
+        return 0
+    n = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn final line from a crash
+            neho_raw[rec["mid"]] = rec["data"]
+            current_prices[rec["mid"]] = rec["data"]
+            n += 1
+    return n
+
+
+def load_known_404(path):
+    """Slugs that already came back 404 — a page load buys nothing there."""
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            return set(json.load(f))
+    return set()
+
+
+async def create_context(browser):
     """Create a fresh browser context with randomised fingerprint."""
-    ua_variants = [
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
-    ]
-    ctx = browser.new_context(
-        user_agent=random.choice(ua_variants),
+    ctx = await browser.new_context(
+        user_agent=random.choice(UA_VARIANTS),
         locale="de-CH",
         viewport={"width": random.choice([1280, 1366, 1440, 1920]),
                   "height": random.choice([720, 768, 900, 1080])},
     )
-    ctx.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    await ctx.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    # Abort asset requests at context level; the routing table dies with
+    # the context, so the SESSION_REFRESH_EVERY recycle keeps it from
+    # accumulating over long runs
+    await ctx.route("**/*", block_assets_async)
     return ctx
 
 
-def main():
-    from playwright.sync_api import sync_playwright
+async def new_slot(browser):
+    """Build one pool slot: a warmed context/page plus its pacing state."""
+    ctx = await create_context(browser)
+    page = await ctx.new_page()
+    try:
+        await page.goto(WARMUP_URL, timeout=30000, wait_until="domcontentloaded")
+        await asyncio.sleep(3)
+    except Exception:
+        pass
+    return {"ctx": ctx, "page": page, "bucket": TokenBucket(), "fetched": 0}
+
+
+async def fetch_one(page, url):
+    """Navigate and classify; returns (kind, price_data, retry_after)."""
+    try:
+        resp = await page.goto(url, timeout=20000, wait_until="domcontentloaded")
+        status = resp.status if resp else 0
+
+        if status == 404:
+            return "404", None, None
+        if status == 403:
+            return "err", None, resp.headers.get("retry-after")
+        if status == 200:
+            title = await page.title()
+            if "just a moment" in title.lower() or "cloudflare" in title.lower():
+                await asyncio.sleep(8)
+                try:
+                    await page.wait_for_load_state("domcontentloaded", timeout=10000)
+                except Exception:
+                    pass
+
+            # Wait until JS has actually filled the price element
+            # instead of guessing with a fixed sleep
+            try:
+                await page.wait_for_function(
+                    "document.querySelector('.js-priceAverageApartments')"
+                    "?.textContent?.trim().length > 0",
+                    timeout=6000)
+            except Exception:
+                pass
+
+            price_data = await extract_prices_from_page(page)
+            if price_data:
+                return "ok", price_data, None
+    except Exception:
+        pass
+    return "err", None, None
+
 
+async def main():
     # Load data
     with open(PROCESSED_DIR / "municipalities.json") as f:
         municipalities = json.load(f)
@@ -110,6 +318,10 @@ def main():
     with open(PROCESSED_DIR / "prices_neho.json") as f:
         neho_raw = json.load(f)
 
+    replayed = replay_jsonl(JSONL_PATH, neho_raw, current_prices)
+    if replayed:
+        print(f"Replayed {replayed} entries from {JSONL_PATH.name}")
+
     all_munis = {m["id"]: m for m in municipalities}
     have_price = set(current_prices.keys())
     missing_ids = set(all_munis.keys()) - have_price
@@ -121,143 +333,147 @@ def main():
         slug = normalize(m["name"])
         slug_to_mids.setdefault(slug, []).append(mid)
 
-    # Build URL list (shuffle to reduce pattern detection)
+    # Build URL list (shuffle to reduce pattern detection), skipping
+    # slugs a previous run already confirmed as 404
+    known_404 = load_known_404(NOT_FOUND_PATH)
     urls = [(slug, f"https://neho.ch/de/quadratmeterpreis-{slug}")
-            for slug in slug_to_mids.keys()]
+            for slug in slug_to_mids.keys() if slug not in known_404]
     random.shuffle(urls)
 
-    print(f"Missing prices: {len(missing_ids)} municipalities ({len(urls)} unique slugs)")
+    print(f"Missing prices: {len(missing_ids)} municipalities ({len(urls)} unique slugs, "
+          f"{len(slug_to_mids) - len(urls)} known 404s skipped)")
     sys.stdout.flush()
 
     if not urls:
         print("Nothing to fetch!")
         return
 
-    with sync_playwright() as p:
-        # Use system Chrome in headed mode — headless Chromium gets blocked by CF
-        browser = p.chromium.launch(
-            headless=False,
-            channel="chrome",
-        )
-
-        ctx = create_context(browser)
-        page = ctx.new_page()
-
-        # Warm up with main page
-        print("Warming up...")
-        sys.stdout.flush()
-        try:
-            page.goto("https://neho.ch/de/immobilienpreise-schweiz",
-                       timeout=30000, wait_until="domcontentloaded")
-            time.sleep(3)
-        except Exception:
-            pass
-
-        success = 0
-        errors = 0
-        not_found = 0
-        consecutive_errors = 0
-
-        for i, (slug, url) in enumerate(urls):
-            # Periodic session refresh
-            if i > 0 and i % SESSION_REFRESH_EVERY == 0:
-                print(f"  Refreshing browser session...")
-                sys.stdout.flush()
-                try:
-                    page.close()
-                    ctx.close()
-                except Exception:
-                    pass
-                ctx = create_context(browser)
-                page = ctx.new_page()
-                try:
-                    page.goto("https://neho.ch/de/immobilienpreise-schweiz",
-                               timeout=30000, wait_until="domcontentloaded")
-                    time.sleep(3)
-                except Exception:
-                    pass
-
-            try:
-                resp = page.goto(url, timeout=20000, wait_until="domcontentloaded")
-                status = resp.status if resp else 0
-
-                if status == 404:
-                    not_found += 1
-                    consecutive_errors = 0
-                elif status == 403:
-                    errors += 1
-                    consecutive_errors += 1
-                elif status == 200:
-                    title = page.title()
-                    if "just a moment" in title.lower() or "cloudflare" in title.lower():
-                        time.sleep(8)
-                        try:
-                            page.wait_for_load_state("domcontentloaded", timeout=10000)
-                        except Exception:
-                            pass
-
-                    # Wait for JS to populate price elements
-                    time.sleep(3)
-
-                    price_data = extract_prices_from_page(page)
-                    if price_data:
-                        for mid in slug_to_mids.get(slug, []):
-                            neho_raw[mid] = price_data
-                            current_prices[mid] = price_data
-                        success += 1
-                        consecutive_errors = 0
-                    else:
-                        errors += 1
-                        consecutive_errors += 1
-                else:
-                    errors += 1
-                    consecutive_errors += 1
-
-            except Exception:
-                errors += 1
-                consecutive_errors += 1
-
-            # If too many consecutive errors, long pause + session refresh
-            if consecutive_errors >= 15:
-                print(f"  15 consecutive errors — pausing 60s + refreshing session...")
-                sys.stdout.flush()
-                time.sleep(60)
-                consecutive_errors = 0
-                try:
-                    page.close()
-                    ctx.close()
-                except Exception:
-                    pass
-                ctx = create_context(browser)
-                page = ctx.new_page()
-                try:
-                    page.goto("https://neho.ch/de/immobilienpreise-schweiz",
-                               timeout=30000, wait_until="domcontentloaded")
-                    time.sleep(5)
-                except Exception:
-                    pass
+    # Fast lane first: most price pages are server-rendered, so a pooled
+    # GET resolves them without a browser. Only slugs Cloudflare refuses
+    # (or that render client-side) go to the Playwright slow lane below.
+    print(f"Fast pass: static GETs over {len(urls)} slugs...")
+    sys.stdout.flush()
+    fast_ok = 0
+    needs_browser = []
+    with ThreadPoolExecutor(max_workers=FAST_WORKERS) as pool, \
+            open(JSONL_PATH, "a", encoding="utf-8") as jsonl_f:
+        results = pool.map(fetch_fast, (url for _, url in urls))
+        for (slug, url), (kind, price_data) in zip(urls, results):
+            if kind == "ok":
+                for mid in slug_to_mids.get(slug, []):
+                    neho_raw[mid] = price_data
+                    current_prices[mid] = price_data
+                    jsonl_f.write(json.dumps({"mid": mid, "data": price_data},
+                                             ensure_ascii=False) + "\n")
+                fast_ok += 1
+            elif kind == "404":
+                known_404.add(slug)
+            else:
+                needs_browser.append((slug, url))
+    print(f"  Fast pass: {fast_ok} ok, "
+          f"{len(urls) - fast_ok - len(needs_browser)} 404, "
+          f"{len(needs_browser)} need the browser")
+    sys.stdout.flush()
+    urls = needs_browser
 
-            done = i + 1
-            if done % SAVE_EVERY == 0 or done == len(urls):
-                real = {k: v for k, v in neho_raw.items() if not k.startswith("_slug_")}
-                print(f"  Progress: {done}/{len(urls)} "
-                      f"({success} ok, {not_found} 404, {errors} err) "
-                      f"| total prices: {len(real)}")
-                sys.stdout.flush()
-                with open(PROCESSED_DIR / "prices_neho.json", "w") as f:
-                    json.dump(neho_raw, f, indent=2, ensure_ascii=False)
-                with open(PROCESSED_DIR / "prices.json", "w") as f:
-                    json.dump({k: v for k, v in neho_raw.items() if not k.startswith("_slug_")},
-                              f, indent=2, ensure_ascii=False)
+    stats = {"success": 0, "errors": 0, "not_found": 0, "done": 0, "n_known": len(known_404)}
+    n_workers = min(WORKERS, max(len(urls), 1))
+    sem = asyncio.Semaphore(n_workers)
+    write_lock = asyncio.Lock()  # serializes dict updates + file writes
 
-            # Randomised delay
-            time.sleep(random.uniform(DELAY_MIN, DELAY_MAX))
+    print(f"Starting {n_workers} async contexts...")
+    sys.stdout.flush()
 
-        browser.close()
+    from playwright.async_api import async_playwright
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=False, channel="chrome")
+        # Context pool: one event loop drives n_workers in-flight
+        # navigations in a single browser process — no thread per worker
+        pool = asyncio.Queue()
+        for _ in range(n_workers):
+            pool.put_nowait(await new_slot(browser))
+
+        with open(JSONL_PATH, "a", encoding="utf-8") as jsonl_f:
+
+            async def scrape(slug, url):
+                async with sem:
+                    slot = await pool.get()
+                    try:
+                        # Periodic context recycle, as before, but per slot
+                        if slot["fetched"] and slot["fetched"] % SESSION_REFRESH_EVERY == 0:
+                            try:
+                                await slot["ctx"].close()
+                            except Exception:
+                                pass
+                            fresh = await new_slot(browser)
+                            fresh["fetched"] = slot["fetched"]
+                            fresh["bucket"] = slot["bucket"]
+                            slot = fresh
+
+                        kind, price_data, retry_after = await fetch_one(slot["page"], url)
+                        slot["fetched"] += 1
+
+                        async with write_lock:
+                            if kind == "ok":
+                                stats["success"] += 1
+                                for mid in slug_to_mids.get(slug, []):
+                                    neho_raw[mid] = price_data
+                                    current_prices[mid] = price_data
+                                    jsonl_f.write(json.dumps(
+                                        {"mid": mid, "data": price_data},
+                                        ensure_ascii=False) + "\n")
+                                jsonl_f.flush()
+                            elif kind == "404":
+                                stats["not_found"] += 1
+                                known_404.add(slug)
+                            else:
+                                stats["errors"] += 1
+                            stats["done"] += 1
+                            if stats["done"] % SAVE_EVERY == 0 or stats["done"] == len(urls):
+                                real = {k: v for k, v in neho_raw.items()
+                                        if not k.startswith("_slug_")}
+                                print(f"  Progress: {stats['done']}/{len(urls)} "
+                                      f"({stats['success']} ok, {stats['not_found']} 404, "
+                                      f"{stats['errors']} err) | total prices: {len(real)}")
+                                sys.stdout.flush()
+                                if len(known_404) > stats["n_known"]:
+                                    with open(NOT_FOUND_PATH, "w", encoding="utf-8") as f:
+                                        json.dump(sorted(known_404), f)
+                                    stats["n_known"] = len(known_404)
+
+                        if kind == "err":
+                            slot["bucket"].on_block(retry_after)
+                        else:
+                            slot["bucket"].on_success()
+                        await slot["bucket"].acquire()
+                    finally:
+                        pool.put_nowait(slot)
+
+            await asyncio.gather(*(scrape(slug, url) for slug, url in urls))
+
+        while not pool.empty():
+            slot = pool.get_nowait()
+            try:
+                await slot["ctx"].close()
+            except Exception:
+                pass
+        await browser.close()
+
+    # Merge once: full dumps, then the sidecar has served its purpose
+    with open(PROCESSED_DIR / "prices_neho.json", "w") as f:
+        json.dump(neho_raw, f, indent=2, ensure_ascii=False)
+    with open(PROCESSED_DIR / "prices.json", "w") as f:
+        json.dump({k: v for k, v in neho_raw.items() if not k.startswith("_slug_")},
+                  f, indent=2, ensure_ascii=False)
+    with open(NOT_FOUND_PATH, "w", encoding="utf-8") as f:
+        json.dump(sorted(known_404), f)
+    JSONL_PATH.unlink(missing_ok=True)
 
     # Final summary
     real = {k: v for k, v in neho_raw.items() if not k.startswith("_slug_")}
-    print(f"\nDone: {success} new, {not_found} 404, {errors} errors")
+    print(f"\nDone: {stats['success']} new, {stats['not_found']} 404, "
+          f"{stats['errors']} errors")
     print(f"Total BFS-matched prices: {len(real)}/{len(municipalities)}")
     vals = [v["chf_per_m2"] for v in real.values() if v.get("chf_per_m2")]
     if vals:
@@ -265,4 +481,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -15,45 +15,121 @@ import random
 import re
 import sys
 import time
+from functools import lru_cache
 from pathlib import Path
 
+from _neho_driver import block_assets
 from config import PROCESSED_DIR
 
 PROFILE_DIR = Path("/tmp/neho_chrome_profile")
-DELAY_MIN = 3.0
-DELAY_MAX = 7.0
 SAVE_EVERY = 10
 SESSION_REFRESH_EVERY = 40
+# Closing the page alone doesn't release what the context accumulates,
+# so the whole persistent context is reopened on this coarser cycle
+PERSISTENT_REFRESH_EVERY = 150
+# Append-only sidecar: one line per hit, replayed on resume after a crash
+JSONL_PATH = PROCESSED_DIR / "prices_neho.jsonl"
+# Slugs confirmed 404 on Neho; reruns skip them instead of re-navigating
+NOT_FOUND_PATH = PROCESSED_DIR / "neho_404.json"
+
+
+class TokenBucket:
+    """Adaptive pacing, tuned much slower than the basic retry.
+
+    This run trades throughput for staying under the radar: the healthy
+    ceiling is one page every ~3s, and any block halves the rate down to
+    one page every 20s.
+    """
+
+    RATE_MIN = 0.05  # tokens/sec under pushback (~20s/page)
+    RATE_MAX = 0.3  # tokens/sec ceiling while healthy (~3s/page)
+
+    def __init__(self, rate=0.15):
+        self.rate = rate
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(1.0, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        self._refill()
+        if self.tokens < 1.0:
+            time.sleep((1.0 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1.0
+
+    def on_success(self):
+        self.rate = min(self.RATE_MAX, self.rate * 1.2)
+
+    def on_block(self, retry_after=None):
+        self.rate = max(self.RATE_MIN, self.rate * 0.5)
+        self.tokens = 0.0
+        if retry_after:
+            try:
+                # Retry-After is authoritative: drain below zero so the
+                # next acquire waits it out on top of the refill
+                self.tokens = -min(120.0, float(retry_after)) * self.rate
+            except ValueError:
+                pass
+
+
+# Module-level patterns/tables \u2014 same hot path as 03b_retry_neho
+_RE_PRICE = re.compile(r"\d+")  # digit runs, after the translate pass
+_STRIP_APOS = str.maketrans("", "", "' \u2019")  # thousands separators
+_RE_CHF_INFO = re.compile(r"CHF\s+([\d'\u2019]+)")
+_RE_PAREN = re.compile(r"\s*\(.*?\)")
+_RE_DASHES = re.compile(r"-+")
+_RE_NONALNUM = re.compile(r"[^a-z0-9-]")
+_DIACRITICS = str.maketrans({
+    "\u00e4": "ae", "\u00f6": "oe", "\u00fc": "ue",
+    "\u00e0": "a", "\u00e2": "a", "\u00e9": "e", "\u00e8": "e",
+    "\u00ea": "e", "\u00eb": "e", "\u00f4": "o", "\u00ee": "i",
+    "\u00ef": "i", "\u00fb": "u", "\u00f9": "u", "\u00e7": "c",
+})
 
 
 def parse_chf(text):
+    """One translate pass then one scan \u2014 no per-token re-cleaning."""
     if not text:
         return None
-    cleaned = text.replace("CHF", "").strip()
-    cleaned = cleaned.replace("'", "").replace("\u2019", "").replace(" ", "")
-    match = re.search(r"(\d+)", cleaned)
-    return int(match.group(1)) if match else None
+    m = _RE_PRICE.search(text.translate(_STRIP_APOS))
+    return int(m.group(0)) if m else None
+
+
+# Single evaluate round-trip for all five fields (see 03b_retry_neho)
+PRICE_FIELDS_JS = """() => {
+    const q = s => document.querySelector(s)?.textContent?.trim() || null;
+    return {
+        apt: q('.js-priceAverageApartments'),
+        house: q('.js-priceAverageHouses'),
+        info: q('.js-pageSearchInfo'),
+        range_apt: q('.js-priceRangeApartments'),
+        range_house: q('.js-priceRangeHouses'),
+    };
+}"""
+
+
+def parse_range(text):
+    # Strip separators up front so each match is already a clean int;
+    # spaces go too, which keeps "CHF 8'000" a single number
+    nums = [int(m.group(0))
+            for m in _RE_PRICE.finditer(text.translate(_STRIP_APOS))]
+    return (nums[0], nums[1]) if len(nums) >= 2 else (None, None)
 
 
 def extract_prices_from_page(page):
-    def safe_text(selector):
-        el = page.query_selector(selector)
-        return el.text_content().strip() if el else None
-
-    avg_apt = parse_chf(safe_text(".js-priceAverageApartments"))
-    avg_house = parse_chf(safe_text(".js-priceAverageHouses"))
-    info = safe_text(".js-pageSearchInfo") or ""
-    m = re.search(r"CHF\s+([\d'\u2019]+)", info)
-    avg_overall = parse_chf(m.group(1)) if m else None
+    data = page.evaluate(PRICE_FIELDS_JS)
 
-    range_apt = safe_text(".js-priceRangeApartments") or ""
-    range_house = safe_text(".js-priceRangeHouses") or ""
+    avg_apt = parse_chf(data["apt"])
+    avg_house = parse_chf(data["house"])
+    m = _RE_CHF_INFO.search(data["info"] or "")
+    avg_overall = parse_chf(m.group(1)) if m else None
 
-    def parse_range(text):
-        nums = re.findall(r"[\d'\u2019]+", text)
-        parsed = [int(n.replace("'", "").replace("\u2019", ""))
-                  for n in nums if n.replace("'", "").replace("\u2019", "").isdigit()]
-        return (parsed[0], parsed[1]) if len(parsed) >= 2 else (None, None)
+    range_apt = data["range_apt"] or ""
+    range_house = data["range_house"] or ""
 
     min_apt, max_apt = parse_range(range_apt)
     min_house, max_house = parse_range(range_house)
@@ -75,19 +151,44 @@ def extract_prices_from_page(page):
     }
 
 
+@lru_cache(maxsize=4096)
 def normalize(name):
-    n = name.lower().strip()
-    n = n.replace("ä", "ae").replace("ö", "oe").replace("ü", "ue")
-    n = n.replace("à", "a").replace("â", "a").replace("é", "e").replace("è", "e")
-    n = n.replace("ê", "e").replace("ë", "e").replace("ô", "o").replace("î", "i")
-    n = n.replace("ï", "i").replace("û", "u").replace("ù", "u").replace("ç", "c")
-    n = re.sub(r"\s*\(.*?\)", "", n)
+    n = name.lower().strip().translate(_DIACRITICS)
+    n = _RE_PAREN.sub("", n)
     n = n.replace(" ", "-").replace("/", "-").replace(".", "-").replace("'", "-")
-    n = re.sub(r"-+", "-", n).strip("-")
-    n = re.sub(r"[^a-z0-9-]", "", n)
+    n = _RE_DASHES.sub("-", n).strip("-")
+    n = _RE_NONALNUM.sub("", n)
     return n
 
 
+def replay_jsonl(path, neho_raw, current_prices):
+    """Fold sidecar lines from a crashed run back into the price dicts."""
+    if not path.exists():
+        return 0
+    n = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn final line from a crash
+            neho_raw[rec["mid"]] = rec["data"]
+            current_prices[rec["mid"]] = rec["data"]
+            n += 1
+    return n
+
+
+def load_known_404(path):
+    """Slugs that already came back 404 — a page load buys nothing there."""
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            return set(json.load(f))
+    return set()
+
+
 # Known Neho pages that we already scraped successfully — use them as decoy visits
 DECOY_SLUGS = [
     "zuerich", "bern", "luzern", "basel", "geneve", "lausanne",
@@ -115,6 +216,39 @@ def visit_decoy(page):
         pass
 
 
+def open_persistent(p, stealth):
+    """(Re)open the persistent profile and return a stealthed (context, page).
+
+    Reopening the same profile dir keeps the Cloudflare cookies; the
+    close/reopen cycle is what bounds Chromium's memory on long runs.
+    """
+    context = p.chromium.launch_persistent_context(
+        user_data_dir=str(PROFILE_DIR),
+        headless=False,
+        channel="chrome",
+        locale="de-CH",
+        viewport={"width": 1366, "height": 768},
+        args=[
+            "--disable-blink-features=AutomationControlled",
+        ],
+    )
+    # Only DOM text is read — images, fonts, styles and media are
+    # dead weight, and the persistent profile runs for hours
+    context.route("**/*", block_assets)
+    page = context.pages[0] if context.pages else context.new_page()
+    stealth.apply_stealth_sync(page)
+    return context, page
+
+
+def close_persistent(context):
+    """Serialize cookies next to the profile, then close the context."""
+    try:
+        context.storage_state(path=str(PROFILE_DIR / "storage.json"))
+    except Exception:
+        pass
+    context.close()
+
+
 def main():
     from playwright.sync_api import sync_playwright
     from playwright_stealth import Stealth
@@ -131,6 +265,10 @@ def main():
     with open(PROCESSED_DIR / "prices_neho.json") as f:
         neho_raw = json.load(f)
 
+    replayed = replay_jsonl(JSONL_PATH, neho_raw, current_prices)
+    if replayed:
+        print(f"Replayed {replayed} entries from {JSONL_PATH.name}")
+
     all_munis = {m["id"]: m for m in municipalities}
     have_price = set(current_prices.keys())
     missing_ids = set(all_munis.keys()) - have_price
@@ -141,11 +279,15 @@ def main():
         slug = normalize(m["name"])
         slug_to_mids.setdefault(slug, []).append(mid)
 
+    # Skip slugs a previous run already confirmed as 404 — at this
+    # script's delays each avoided load saves the most time of all runs
+    known_404 = load_known_404(NOT_FOUND_PATH)
     urls = [(slug, f"https://neho.ch/de/quadratmeterpreis-{slug}")
-            for slug in slug_to_mids.keys()]
+            for slug in slug_to_mids.keys() if slug not in known_404]
     random.shuffle(urls)
 
-    print(f"Missing: {len(missing_ids)} municipalities ({len(urls)} unique slugs)")
+    print(f"Missing: {len(missing_ids)} municipalities ({len(urls)} unique slugs, "
+          f"{len(slug_to_mids) - len(urls)} known 404s skipped)")
     sys.stdout.flush()
 
     if not urls:
@@ -154,20 +296,12 @@ def main():
 
     PROFILE_DIR.mkdir(parents=True, exist_ok=True)
 
+    # Hits append here (O(1) per hit); full dumps happen once at the end
+    jsonl_f = open(JSONL_PATH, "a", encoding="utf-8")
+
     with sync_playwright() as p:
         # Launch persistent context with system Chrome
-        context = p.chromium.launch_persistent_context(
-            user_data_dir=str(PROFILE_DIR),
-            headless=False,
-            channel="chrome",
-            locale="de-CH",
-            viewport={"width": 1366, "height": 768},
-            args=[
-                "--disable-blink-features=AutomationControlled",
-            ],
-        )
-        page = context.pages[0] if context.pages else context.new_page()
-        stealth.apply_stealth_sync(page)
+        context, page = open_persistent(p, stealth)
 
         # Warm up — visit homepage, scroll around
         print("Warming up with homepage...")
@@ -188,15 +322,26 @@ def main():
         success = 0
         errors = 0
         not_found = 0
-        consecutive_errors = 0
+        n_known = len(known_404)
+        bucket = TokenBucket()
 
         for i, (slug, url) in enumerate(urls):
             # Occasional decoy visit (every ~10-15 pages)
             if i > 0 and random.random() < 0.08:
                 visit_decoy(page)
 
+            # Coarse refresh: reopen the whole persistent context so the
+            # run's memory stays bounded (the page refresh below is not
+            # enough — leaked state lives on the context)
+            if i > 0 and i % PERSISTENT_REFRESH_EVERY == 0:
+                print(f"  Recycling persistent context...")
+                sys.stdout.flush()
+                close_persistent(context)
+                context, page = open_persistent(p, stealth)
+                visit_decoy(page)
+
             # Session refresh: close & reopen page
-            if i > 0 and i % SESSION_REFRESH_EVERY == 0:
+            elif i > 0 and i % SESSION_REFRESH_EVERY == 0:
                 print(f"  Refreshing page...")
                 sys.stdout.flush()
                 page.close()
@@ -211,16 +356,19 @@ def main():
                     pass
                 visit_decoy(page)
 
+            retry_after = None
+            blocked = False
             try:
                 resp = page.goto(url, timeout=25000, wait_until="domcontentloaded")
                 status = resp.status if resp else 0
 
                 if status == 404:
                     not_found += 1
-                    consecutive_errors = 0
+                    known_404.add(slug)
                 elif status == 403:
+                    retry_after = resp.headers.get("retry-after")
                     errors += 1
-                    consecutive_errors += 1
+                    blocked = True
                 elif status == 200:
                     title = page.title()
                     if "just a moment" in title.lower() or "cloudflare" in title.lower():
@@ -231,8 +379,14 @@ def main():
                         except Exception:
                             pass
 
-                    # Wait for JS rendering
-                    time.sleep(random.uniform(3, 5))
+                    # Wait for the price element to render, not a guessed delay
+                    try:
+                        page.wait_for_function(
+                            "document.querySelector('.js-priceAverageApartments')"
+                            "?.textContent?.trim().length > 0",
+                            timeout=6000)
+                    except Exception:
+                        pass
                     human_scroll(page)
 
                     price_data = extract_prices_from_page(page)
@@ -240,34 +394,21 @@ def main():
                         for mid in slug_to_mids.get(slug, []):
                             neho_raw[mid] = price_data
                             current_prices[mid] = price_data
+                            jsonl_f.write(json.dumps(
+                                {"mid": mid, "data": price_data},
+                                ensure_ascii=False) + "\n")
+                        jsonl_f.flush()
                         success += 1
-                        consecutive_errors = 0
                     else:
                         errors += 1
-                        consecutive_errors += 1
+                        blocked = True
                 else:
                     errors += 1
-                    consecutive_errors += 1
+                    blocked = True
 
             except Exception:
                 errors += 1
-                consecutive_errors += 1
-
-            # Long pause after many consecutive errors
-            if consecutive_errors >= 10:
-                print(f"  10 consecutive errors — pausing 90s...")
-                sys.stdout.flush()
-                time.sleep(90)
-                consecutive_errors = 0
-                # Visit homepage to reset
-                try:
-                    page.goto("https://neho.ch/de/immobilienpreise-schweiz",
-                               timeout=30000, wait_until="domcontentloaded")
-                    time.sleep(5)
-                    human_scroll(page)
-                except Exception:
-                    pass
-                visit_decoy(page)
+                blocked = True
 
             done = i + 1
             if done % SAVE_EVERY == 0 or done == len(urls):
@@ -276,19 +417,33 @@ def main():
                       f"({success} ok, {not_found} 404, {errors} err) "
                       f"| total: {len(real)}")
                 sys.stdout.flush()
-                with open(PROCESSED_DIR / "prices_neho.json", "w") as f:
-                    json.dump(neho_raw, f, indent=2, ensure_ascii=False)
-                with open(PROCESSED_DIR / "prices.json", "w") as f:
-                    json.dump({k: v for k, v in neho_raw.items()
-                               if not k.startswith("_slug_")},
-                              f, indent=2, ensure_ascii=False)
+                if len(known_404) > n_known:
+                    with open(NOT_FOUND_PATH, "w", encoding="utf-8") as f:
+                        json.dump(sorted(known_404), f)
+                    n_known = len(known_404)
+
+            # Adaptive pacing: rate climbs on served responses, halves
+            # on blocks (Retry-After-aware) — no hard-pause needed, the
+            # bucket collapses the rate on its own when we're being hit
+            if blocked:
+                bucket.on_block(retry_after)
+            else:
+                bucket.on_success()
+            bucket.acquire()
 
-            # Human-like random delay
-            time.sleep(random.uniform(DELAY_MIN, DELAY_MAX))
+        close_persistent(context)
 
-        context.close()
+    jsonl_f.close()
 
+    # Merge once: full dumps, then the sidecar has served its purpose
     real = {k: v for k, v in neho_raw.items() if not k.startswith("_slug_")}
+    with open(PROCESSED_DIR / "prices_neho.json", "w") as f:
+        json.dump(neho_raw, f, indent=2, ensure_ascii=False)
+    with open(PROCESSED_DIR / "prices.json", "w") as f:
+        json.dump(real, f, indent=2, ensure_ascii=False)
+    with open(NOT_FOUND_PATH, "w", encoding="utf-8") as f:
+        json.dump(sorted(known_404), f)
+    JSONL_PATH.unlink(missing_ok=True)
     print(f"\nDone: {success} new, {not_found} 404, {errors} errors")
     print(f"Total BFS-matched prices: {len(real)}/{len(municipalities)}")
     vals = [v["chf_per_m2"] for v in real.values() if v.get("chf_per_m2")]
@@ -0,0 +1,124 @@
+"""
+Shared Playwright setup for the Neho scrapers.
+
+03b_fetch_prices_neho (async worker pool) and 03b_final_neho_sweep
+(sync last-resort pass) need the same browser fingerprint: user agent,
+locale, webdriver patch, asset blocking, Cloudflare warmup and clearance
+cookies. Keeping the policy here means the two scripts can't drift apart
+and each pays for exactly one browser launch.
+"""
+import time
+from contextlib import contextmanager
+
+from config import PROCESSED_DIR
+
+USER_AGENT = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/122.0.0.0 Safari/537.36"
+)
+WARMUP_URL = "https://neho.ch/de/immobilienpreise-schweiz"
+# Cloudflare clearance cookies, shared between the scrapers and runs
+CF_STATE_PATH = PROCESSED_DIR / "neho_cf_state.json"
+
+LAUNCH_ARGS = [
+    "--disable-blink-features=AutomationControlled",
+    "--disable-features=IsolateOrigins,site-per-process",
+]
+INIT_SCRIPT = (
+    "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+)
+
+# Only DOM text is read from these pages, so images, fonts, styles and
+# media are dead weight (most of the page bytes). Scripts and XHR stay
+# enabled — the .js-price* fields are populated by JS.
+BLOCKED_RESOURCES = {"image", "media", "font", "stylesheet", "websocket"}
+
+ROTATE_EVERY = 200  # pages per context before the async pool recycles it
+
+VIEWPORT = {"width": 1280, "height": 720}
+LOCALE = "de-CH"
+
+
+def block_assets(route):
+    if route.request.resource_type in BLOCKED_RESOURCES:
+        route.abort()
+    else:
+        route.continue_()
+
+
+async def block_assets_async(route):
+    if route.request.resource_type in BLOCKED_RESOURCES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def new_async_context(browser, storage_state=None):
+    """Create a configured context for the async worker pool.
+
+    Long-lived Playwright contexts leak memory over thousands of goto's,
+    so the fetch loop recycles contexts every ROTATE_EVERY pages, carrying
+    the Cloudflare cookies over via storage_state.
+    """
+    context = await browser.new_context(
+        user_agent=USER_AGENT,
+        locale=LOCALE,
+        viewport=VIEWPORT,
+        storage_state=storage_state,
+    )
+    await context.add_init_script(INIT_SCRIPT)
+    # Block once at context level so every worker page inherits the filter
+    await context.route("**/*", block_assets_async)
+    return context
+
+
+def warmup(page):
+    """Visit the landing page to earn CF cookies and clear the banner."""
+    try:
+        page.goto(WARMUP_URL, timeout=30000, wait_until="domcontentloaded")
+        time.sleep(3)
+        # One locator click instead of scanning every button's text
+        # (matches "Akzeptieren"/"akzeptieren"); absent banner just times out
+        page.locator("button:has-text('kzeptieren')").first.click(timeout=2000)
+        time.sleep(1)
+    except Exception:
+        pass
+
+
+@contextmanager
+def neho_context(storage_state=None, headless=True, channel=None,
+                 stealth=None):
+    """Yield a warmed (context, page) pair with the shared Neho policy.
+
+    Saves the context's storage state back to CF_STATE_PATH on exit so
+    the next run (or the other script) reuses the clearance cookies.
+    """
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as p:
+        kwargs = {"headless": headless, "args": LAUNCH_ARGS}
+        if channel:
+            kwargs["channel"] = channel
+        browser = p.chromium.launch(**kwargs)
+        context = browser.new_context(
+            user_agent=USER_AGENT,
+            locale=LOCALE,
+            viewport=VIEWPORT,
+            storage_state=storage_state,
+        )
+        context.add_init_script(INIT_SCRIPT)
+        context.route("**/*", block_assets)
+        page = context.new_page()
+        if stealth is not None:
+            stealth.apply_stealth_sync(page)
+        warmup(page)
+        try:
+            yield context, page
+        finally:
+            try:
+                context.storage_state(path=str(CF_STATE_PATH))
+            except Exception:
+                pass
+            context.close()
+            browser.close()